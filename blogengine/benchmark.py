@@ -0,0 +1,210 @@
+import datetime
+import math
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+from blogengine.counters import get_site_post_count, repair_post_counts
+from blogengine.explain import get_view_urls
+from blogengine.factories import SiteFactory, CategoryFactory, TagFactory, AuthorFactory, FlatPageFactory, PostFactory
+from blogengine.markup import render_markdown, render_excerpt
+from blogengine.models import Post, SearchTerm
+from blogengine.search import get_term_weights
+
+# Seeds a synthetic corpus of posts with bulk inserts, then requests one URL of
+# every named route a number of times and reports the latency, the number of
+# queries and the size of each response.
+
+# Number of categories and tags of the corpus, and number of tags per post
+CATEGORIES = 20
+TAGS = 50
+TAGS_PER_POST = 3
+
+# Number of posts inserted per batch
+BATCH_SIZE = 500
+
+# Time between two consecutive posts
+POST_INTERVAL = datetime.timedelta(minutes = 10)
+
+WORDS = ('data science model regression python django cache query index markdown template '
+	'feed archive category tag search latency benchmark cursor sitemap server view post').split()
+
+# Get the markdown texts posts are made of. Their HTML and search terms are computed once, not per post.
+def get_texts(count = 50, seed = 0):
+
+	generator = random.Random(seed)
+	texts = []
+
+	for number in range(count):
+		paragraphs = ['# ' + ' '.join(generator.sample(WORDS, 3)).capitalize()]
+
+		for paragraph in range(generator.randint(2, 6)):
+			paragraphs.append(' '.join(generator.choice(WORDS) for word in range(generator.randint(40, 120))) + '.')
+
+		text = '\n\n'.join(paragraphs)
+		html = render_markdown(text)
+		excerpt, has_more = render_excerpt(text, '', html)
+		texts.append({'text': text, 'rendered_text': html, 'excerpt': excerpt, 'has_more': has_more,
+			'weights': get_term_weights('', text)})
+
+	return texts
+
+# Get the categories and tags of the corpus, creating them if needed
+def get_taxonomy():
+
+	categories = [CategoryFactory(name = 'Category {0}'.format(number), slug = 'category-{0}'.format(number),
+		description = 'Benchmark category {0}'.format(number)) for number in range(CATEGORIES)]
+
+	tags = [TagFactory(name = 'Tag {0}'.format(number), slug = 'tag-{0}'.format(number),
+		description = 'Benchmark tag {0}'.format(number)) for number in range(TAGS)]
+
+	return categories, tags
+
+# Insert one batch of posts, with their tags and search index entries
+def create_posts(numbers, texts, author, site, categories, tags, now):
+
+	posts = []
+
+	for number in numbers:
+		text = texts[number % len(texts)]
+		posts.append(PostFactory.build(
+			title = 'Post {0} {1}'.format(number, WORDS[number % len(WORDS)]),
+			slug = 'post-{0}'.format(number),
+			pub_date = now - POST_INTERVAL * number,
+			text = text['text'],
+			rendered_text = text['rendered_text'],
+			excerpt = text['excerpt'],
+			has_more = text['has_more'],
+			author = author,
+			site = site,
+			category = categories[number % len(categories)]))
+
+	Post.objects.bulk_create(posts)
+
+	# Only some databases set the primary keys on bulk inserts
+	pks = dict(Post.objects.filter(slug__in = [post.slug for post in posts]).values_list('slug', 'pk'))
+
+	through = []
+	terms = []
+
+	for number, post in zip(numbers, posts):
+		pk = pks[post.slug]
+
+		for offset in range(TAGS_PER_POST):
+			through.append(Post.tags.through(post_id = pk, tag_id = tags[(number * TAGS_PER_POST + offset) % len(tags)].pk))
+
+		weights = texts[number % len(texts)]['weights'] + get_term_weights(post.title, '')
+		terms += [SearchTerm(post_id = pk, term = term, weight = weight) for term, weight in weights.items()]
+
+	Post.tags.through.objects.bulk_create(through)
+	SearchTerm.objects.bulk_create(terms)
+
+# Add posts until there are total posts in the corpus. Returns the number of posts added.
+def seed_posts(total, batch_size = BATCH_SIZE, stdout = None):
+
+	site = SiteFactory()
+	author = AuthorFactory()
+	categories, tags = get_taxonomy()
+	FlatPageFactory().sites.add(site)
+
+	texts = get_texts()
+	existing = Post.objects.count()
+	now = timezone.now()
+
+	for start in range(existing, total, batch_size):
+		with transaction.atomic():
+			create_posts(list(range(start, min(start + batch_size, total))), texts, author, site, categories, tags, now)
+
+		if stdout is not None:
+			stdout.write('Seeded {0} of {1} posts'.format(min(start + batch_size, total), total))
+
+	# Bulk inserts skip the signal handlers, so recompute the counters and drop every cached entry
+	with transaction.atomic():
+		repair_post_counts()
+
+	for cache in caches.all():
+		cache.clear()
+
+	return max(total - existing, 0)
+
+# Get the value at a percentile of sorted values, by the nearest rank
+def get_percentile(values, percentile):
+	return values[max(int(math.ceil(percentile / 100.0 * len(values))) - 1, 0)]
+
+# Request a URL once, returning the time taken in milliseconds, the number of queries and the response
+def measure(client, url):
+
+	with CaptureQueriesContext(connection) as queries:
+		start = time.perf_counter()
+		response = client.get(url)
+
+		# Streamed responses are only rendered while they are read
+		content = b''.join(response.streaming_content) if response.streaming else response.content
+		elapsed = (time.perf_counter() - start) * 1000
+
+	return elapsed, len(queries), response.status_code, len(content)
+
+# Get the URLs to benchmark, keyed by name: one of every named route, the last index page, and the admin pages
+def get_benchmark_urls():
+
+	urls = get_view_urls()
+
+	view = resolve(urls['index']).func
+	last_page = int(math.ceil(get_site_post_count() / float(view.view_initkwargs['paginate_by'])))
+
+	if last_page > 1:
+		urls['index_last_page'] = reverse('blogengine:index', kwargs = {'page': last_page})
+
+	post = Post.objects.only('pk').first()
+	urls['admin:index'] = reverse('admin:index')
+	urls['admin:blogengine_post_changelist'] = reverse('admin:blogengine_post_changelist')
+
+	if post is not None:
+		urls['admin:blogengine_post_change'] = reverse('admin:blogengine_post_change', args = [post.pk])
+
+	return urls
+
+# Benchmark every URL: one cold request, then the given number of timed requests
+def benchmark_urls(requests = 20):
+
+	client = Client()
+	admin_client = Client()
+
+	if not User.objects.filter(username = 'benchmark').exists():
+		User.objects.create_superuser('benchmark', 'benchmark@example.com', 'benchmark')
+
+	admin_client.force_login(User.objects.get(username = 'benchmark'))
+
+	results = {}
+
+	for name, url in sorted(get_benchmark_urls().items()):
+		current = admin_client if name.startswith('admin:') else client
+		cold_ms, cold_queries, status, size = measure(current, url)
+		timings = []
+		query_counts = []
+
+		for request in range(requests):
+			elapsed, query_count, status, size = measure(current, url)
+			timings.append(elapsed)
+			query_counts.append(query_count)
+
+		timings.sort()
+
+		results[name] = {
+			'url': url,
+			'status': status,
+			'bytes': size,
+			'cold_ms': round(cold_ms, 3),
+			'cold_queries': cold_queries,
+			'p50_ms': round(get_percentile(timings, 50), 3) if timings else None,
+			'p95_ms': round(get_percentile(timings, 95), 3) if timings else None,
+			'queries': max(query_counts) if query_counts else None,
+		}
+
+	return results
@@ -0,0 +1,348 @@
+import datetime
+import hashlib
+import threading
+import time
+import uuid
+
+from contextlib import contextmanager
+from django.conf import settings
+from django.contrib.sites.models import Site
+from django.contrib.sites.shortcuts import get_current_site
+from django.core.cache import caches
+from django.db import transaction
+from django.dispatch import Signal
+from django.urls import resolve, Resolver404
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.http import urlencode
+from blogengine.timing import timed_cache
+
+# Cached pages and fragments record the version of every tag they depend on.
+# Saving or deleting content bumps the versions of the affected tags, which
+# invalidates exactly the entries built from the old versions.
+#
+# An entry is fresh until its soft expiry time and while its tags are unchanged.
+# Only one process at a time rebuilds an out of date entry, holding a lock kept
+# in the cache. Until the entry reaches its hard expiry time, CACHE_STALE_SECONDS
+# later, the other processes serve the old entry meanwhile instead of rebuilding
+# it too. Without an old entry they wait up to CACHE_LOCK_WAIT seconds for the
+# new one before building it themselves. Pages that must be current, such as
+# the pre-rendered ones written to disk, are built inside fresh_entries(),
+# where old entries are never served.
+#
+# Tags are kept per site, e.g. 'site:1:posts', so that publishing on one site
+# leaves the pages of the others cached. Only the tags of what is shared by
+# every site, such as the categories and tags registry, are global.
+
+# Sent with the set of tags, the ids of the sites they were bumped for and the changes of posts that bumped them, if given
+tags_invalidated = Signal(providing_args = ['tags', 'sites', 'changes'])
+
+# Tags of content shared by every site: the taxonomy registry with its counters, and the names of the categories and tags
+GLOBAL_TAGS = ['taxonomy', 'labels']
+
+# Dependency tags of the base layout shown on every HTML page: the flat page navigation and the archive sidebar
+LAYOUT_TAGS = ['layout', 'archive']
+
+# Dependency tag of each sitemap section
+SITEMAP_TAGS = {'posts': 'posts', 'pages': 'flatpages'}
+
+# Dependency tags of the cacheable routes, built from the resolved URL keyword arguments
+ROUTE_TAGS = {
+	'index': lambda kwargs: LAYOUT_TAGS + ['posts'],
+	'post': lambda kwargs: LAYOUT_TAGS + ['post:{0}'.format(kwargs['slug'])],
+	'category': lambda kwargs: LAYOUT_TAGS + ['category:{0}'.format(kwargs['slug'])],
+	'tag': lambda kwargs: LAYOUT_TAGS + ['tag:{0}'.format(kwargs['slug'])],
+	'search': lambda kwargs: LAYOUT_TAGS + ['posts'],
+	'post_archive': lambda kwargs: LAYOUT_TAGS + ['posts'],
+	'post_archive_month': lambda kwargs: LAYOUT_TAGS + ['month:{0}-{1}'.format(int(kwargs['year']), int(kwargs['month']))],
+	'posts_feed': lambda kwargs: ['posts'],
+	'category_feed': lambda kwargs: ['category:{0}'.format(kwargs['slug'])],
+	'tag_feed': lambda kwargs: ['tag:{0}'.format(kwargs['slug'])],
+	'sitemap': lambda kwargs: ['posts', 'flatpages'],
+	'sitemap_section': lambda kwargs: [SITEMAP_TAGS.get(kwargs['section'], 'posts')],
+	'django.contrib.flatpages.views.flatpage': lambda kwargs: LAYOUT_TAGS + ['flatpages'],
+	'archive_fragment': lambda kwargs: ['archive'],
+}
+
+# Query string parameters read by each cacheable route. The others are left out of
+# the cache keys, so that tracking parameters cannot split the cache of a page.
+ROUTE_QUERY_PARAMETERS = {
+	'index': ('after', 'before'),
+	'category': ('after', 'before'),
+	'tag': ('after', 'before'),
+	'search': ('q', 'page'),
+}
+
+# Ports left out of normalized URLs
+DEFAULT_PORTS = {'http': '80', 'https': '443'}
+
+# Cache key set while changed content may not have reached the read replicas yet
+REPLICAS_BEHIND_KEY = 'replicas:behind'
+
+# Rebuild locks taken by this thread, with the token each was taken with
+_locks = threading.local()
+
+# Whether this thread only takes fresh entries
+_fresh = threading.local()
+
+def get_stale_seconds():
+	return getattr(settings, 'CACHE_STALE_SECONDS', 60)
+
+def get_cache():
+	return timed_cache(caches[settings.CACHE_MIDDLEWARE_ALIAS])
+
+# Get the tags of a site, leaving the global tags as they are
+def get_site_tags(site_id, tags):
+	return [tag if tag in GLOBAL_TAGS else 'site:{0}:{1}'.format(site_id, tag) for tag in tags]
+
+def get_version_key(tag):
+	return 'version:{0}'.format(tag)
+
+# Versions start with the time they were made, so pages can tell when their content last changed
+def new_version():
+	return '{0:.6f}:{1}'.format(time.time(), uuid.uuid4().hex)
+
+# Get the time a version was made, or None if it does not hold one
+def get_version_time(version):
+
+	try:
+		return datetime.datetime.fromtimestamp(float(version.split(':', 1)[0]), datetime.timezone.utc)
+	except (AttributeError, ValueError):
+		return None
+
+# Get the current version of each tag, starting a new version for tags not in the cache
+def get_versions(tags):
+
+	cache = get_cache()
+	keys = dict((get_version_key(tag), tag) for tag in tags)
+	found = cache.get_many(list(keys))
+	versions = {}
+
+	for key, tag in keys.items():
+		version = found.get(key)
+
+		if version is None:
+			version = new_version()
+
+			# Another process may have started the version first
+			if not cache.add(key, version, None):
+				version = cache.get(key, version)
+
+		versions[tag] = version
+
+	return versions
+
+# Bump the versions of the given tags for the given sites, or for every site, once the current transaction commits.
+# Changes describe where the changed posts were and are listed, for the pre-rendered pages listing them.
+def invalidate(*tags, sites = None, changes = None):
+
+	tags = set(tag for tag in tags if tag)
+
+	def bump():
+		site_tags = set(GLOBAL_TAGS).intersection(tags)
+		local_tags = tags.difference(GLOBAL_TAGS)
+		site_ids = set()
+
+		if local_tags:
+			site_ids = set(Site.objects.values_list('pk', flat = True) if sites is None else [site for site in sites if site])
+
+		for site_id in site_ids:
+			site_tags.update(get_site_tags(site_id, local_tags))
+
+		# Pages rebuilt under the new versions must be read from the primary, so this is set first
+		if getattr(settings, 'DATABASE_REPLICAS', None):
+			get_cache().set(REPLICAS_BEHIND_KEY, True, getattr(settings, 'DATABASE_REPLICA_PIN_SECONDS', 15))
+
+		get_cache().set_many(dict((get_version_key(tag), new_version()) for tag in site_tags), None)
+		tags_invalidated.send(sender = None, tags = tags, sites = site_ids, changes = changes)
+
+	if tags:
+		transaction.on_commit(bump)
+
+# Resolve the path of a request once, returning None if it matches no URL pattern
+def get_request_match(request):
+
+	if not hasattr(request, '_cache_match'):
+		try:
+			request._cache_match = resolve(request.path_info)
+		except Resolver404:
+			request._cache_match = None
+
+	return request._cache_match
+
+# Get the dependency tags of a request, or None if its response should not be cached
+def get_request_tags(request):
+
+	match = get_request_match(request)
+
+	if match is None:
+		return None
+
+	route_tags = ROUTE_TAGS.get(match.url_name)
+
+	if route_tags is None:
+		return None
+
+	return get_site_tags(get_current_site(request).pk, route_tags(match.kwargs))
+
+# Get the dependency tags of a post. Values not given are read from the post itself.
+def get_post_tags(post, slug = None, pub_date = None, category_slug = None, tag_slugs = None):
+
+	slug = slug or post.slug
+	pub_date = timezone.localtime(pub_date or post.pub_date) if settings.USE_TZ else (pub_date or post.pub_date)
+
+	tags = ['posts', 'post:{0}'.format(slug), 'month:{0}-{1}'.format(pub_date.year, pub_date.month)]
+
+	if category_slug:
+		tags.append('category:{0}'.format(category_slug))
+
+	for tag_slug in tag_slugs or []:
+		tags.append('tag:{0}'.format(tag_slug))
+
+	return tags
+
+# Get the URL of a request as its view sees it: the lower case host without its default port, the path, and
+# the parameters the view reads, sorted. Views read the last value of a parameter, and treat an empty one as missing.
+def get_normalized_url(request):
+
+	host = request.get_host().lower()
+	scheme = request.scheme
+
+	if host.endswith(':' + DEFAULT_PORTS.get(scheme, '')):
+		host = host.rsplit(':', 1)[0]
+
+	match = get_request_match(request)
+	names = ROUTE_QUERY_PARAMETERS.get(match.url_name, ()) if match else ()
+	parameters = [(name, request.GET[name]) for name in sorted(names) if request.GET.get(name)]
+	url = '{0}://{1}{2}'.format(scheme, host, request.path)
+
+	return url + '?' + urlencode(parameters) if parameters else url
+
+def get_url_key(kind, request, key_prefix = ''):
+	url = hashlib.md5(force_bytes(get_normalized_url(request)))
+
+	return '{0}:{1}:{2}:{3}'.format(kind, key_prefix, get_current_site(request).pk, url.hexdigest())
+
+def get_lock_key(key):
+	return 'lock:{0}'.format(key)
+
+# Take the lock for rebuilding an entry, returning whether it was free
+def acquire_entry(key):
+
+	token = new_version()
+
+	if not get_cache().add(get_lock_key(key), token, getattr(settings, 'CACHE_LOCK_TIMEOUT', 30)):
+		return False
+
+	if not hasattr(_locks, 'tokens'):
+		_locks.tokens = {}
+
+	_locks.tokens[key] = token
+
+	return True
+
+# Release the lock for rebuilding an entry, if this thread holds it
+def release_entry(key):
+
+	token = getattr(_locks, 'tokens', {}).pop(key, None)
+
+	if token is not None and get_cache().get(get_lock_key(key)) == token:
+		get_cache().delete(get_lock_key(key))
+
+# Read entries and the versions of their tags in one round trip, returning the entry of each key and whether it is fresh
+def read_entries(keys, tags):
+
+	version_keys = dict((tag, get_version_key(tag)) for tag in tags)
+	found = get_cache().get_many(list(keys) + list(version_keys.values()))
+	now = time.time()
+	entries = {}
+
+	for key in keys:
+		entry = found.get(key)
+
+		if entry is None or (entry['hard'] is not None and entry['hard'] <= now):
+			entries[key] = (None, False)
+			continue
+
+		fresh = entry['soft'] is None or entry['soft'] > now
+
+		for tag, version_key in version_keys.items():
+			if entry['versions'].get(tag) != found.get(version_key):
+				fresh = False
+
+		entries[key] = (entry, fresh)
+
+	return entries
+
+def read_entry(key, tags):
+	return read_entries([key], tags)[key]
+
+# Never serve out of date entries in the block, building them instead
+@contextmanager
+def fresh_entries():
+
+	previous = getattr(_fresh, 'only', False)
+	_fresh.only = True
+
+	try:
+		yield
+	finally:
+		_fresh.only = previous
+
+# Get the cached values of the keys that are still current, or out of date while another process rebuilds them.
+# The keys left out should be built by the caller and stored with set_entries(), which releases their locks.
+def get_entries(keys, tags):
+
+	values = {}
+	waiting = []
+
+	for key, (entry, fresh) in read_entries(keys, tags).items():
+		if fresh:
+			values[key] = entry['value']
+		elif acquire_entry(key) or getattr(_fresh, 'only', False):
+			continue
+		elif entry is not None:
+			values[key] = entry['value']
+		else:
+			waiting.append(key)
+
+	# Wait for the processes holding the locks to store the values
+	deadline = time.time() + getattr(settings, 'CACHE_LOCK_WAIT', 3)
+
+	while waiting and time.time() < deadline:
+		time.sleep(0.05)
+
+		for key, (entry, fresh) in read_entries(waiting, tags).items():
+			if fresh:
+				values[key] = entry['value']
+				waiting.remove(key)
+
+	return values
+
+# Get a cached value as get_entries() does, or None if the caller should build it and store it with set_entry()
+def get_entry(key, tags):
+	return get_entries([key], tags).get(key)
+
+# Store values with the versions their tags had before they were built. They are fresh for timeout seconds,
+# and served while they are rebuilt for CACHE_STALE_SECONDS more. A timeout of None keeps them until their tags change.
+def set_entries(values, versions, timeout):
+
+	if timeout is None:
+		soft = hard = None
+	else:
+		soft = time.time() + timeout
+		hard = soft + get_stale_seconds()
+		timeout += get_stale_seconds()
+
+	get_cache().set_many(dict((key, {'versions': versions, 'value': value, 'soft': soft, 'hard': hard})
+		for key, value in values.items()), timeout)
+
+	for key in values:
+		release_entry(key)
+
+def set_entry(key, versions, value, timeout):
+	set_entries({key: value}, versions, timeout)
+
+# Seconds fragments and stored responses are fresh for, as the pages of the page cache are
+def get_entry_timeout():
+	return settings.CACHE_MIDDLEWARE_SECONDS
@@ -0,0 +1,54 @@
+import hashlib
+
+from django.utils.encoding import force_bytes
+from django.views.decorators.http import condition
+from django.contrib.sites.shortcuts import get_current_site
+from blogengine.cache import LAYOUT_TAGS, get_versions, get_site_tags, get_request_tags, get_version_time
+
+# Validators of a page are derived from the state of what it shows: the newest
+# modification time and the number of its posts, and the versions of its
+# dependency tags and of the category and tag names. The versions also change
+# when something the page shows is deleted, and the time of the newest one is
+# the latest the page can have changed. They are found before anything is
+# rendered, so unchanged pages are answered with 304.
+
+# Lets a view answer conditional GETs, through get_modified_state()
+class ConditionalMixin(object):
+
+	# Get the newest modification time of what the page shows and any other values its content depends on,
+	# as a (last modified, state) pair, or None if the page does not exist
+	def get_modified_state(self):
+		return None
+
+	def get_validators(self):
+
+		if not hasattr(self, '_validators'):
+			found = self.get_modified_state()
+
+			if found is None:
+				self._validators = (None, None)
+			else:
+				last_modified, state = found
+				tags = get_request_tags(self.request) or get_site_tags(get_current_site(self.request).pk, LAYOUT_TAGS)
+				versions = sorted(get_versions(tags + ['labels']).items())
+
+				for tag, version in versions:
+					changed = get_version_time(version)
+
+					if changed and (last_modified is None or changed > last_modified):
+						last_modified = changed
+
+				etag = hashlib.md5(force_bytes(repr((last_modified and last_modified.isoformat(), state, versions))))
+
+				self._validators = (etag.hexdigest(), last_modified)
+
+		return self._validators
+
+	def dispatch(self, request, *args, **kwargs):
+
+		view = condition(
+			etag_func = lambda request, *args, **kwargs: self.get_validators()[0],
+			last_modified_func = lambda request, *args, **kwargs: self.get_validators()[1],
+		)(super(ConditionalMixin, self).dispatch)
+
+		return view(request, *args, **kwargs)
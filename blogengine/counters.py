@@ -0,0 +1,102 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from blogengine.cache import invalidate
+from blogengine.taxonomy import taxonomy
+
+# Posts are counted per category, per tag and per site, so paginators never
+# have to run COUNT(*) queries. Categories and tags are counted both across
+# sites and on each site. The counters are kept by the signal handlers in
+# blogengine.models and can be recomputed with the repair_post_counts command.
+
+# Get the model counting the posts of a category or tag model on each site, and the name of its field for them
+def get_site_count_model(model):
+
+	from blogengine.models import Category, SiteCategoryCount, SiteTagCount
+
+	return (SiteCategoryCount, 'category_id') if model is Category else (SiteTagCount, 'tag_id')
+
+# Add delta to the post counter of the given categories or tags, across sites and on the given site
+def change_post_count(model, pks, delta, site_id):
+
+	pks = [pk for pk in pks if pk]
+
+	if pks and delta:
+		model.objects.filter(pk__in = pks).update(post_count = F('post_count') + delta)
+		change_site_taxonomy_count(model, pks, delta, site_id)
+
+# Add delta to the post counter of the given categories or tags on a site
+def change_site_taxonomy_count(model, pks, delta, site_id):
+
+	pks = [pk for pk in pks if pk]
+
+	if not pks or not delta:
+		return
+
+	counts, field = get_site_count_model(model)
+	found = set(counts.objects.filter(site_id = site_id, **{field + '__in': pks}).values_list(field, flat = True))
+	counts.objects.filter(site_id = site_id, **{field + '__in': found}).update(post_count = F('post_count') + delta)
+
+	# First post of the category or tag on the site, unless another process just created the counter
+	for pk in set(pks).difference(found):
+		try:
+			with transaction.atomic():
+				counts.objects.create(site_id = site_id, post_count = max(delta, 0), **{field: pk})
+		except IntegrityError:
+			counts.objects.filter(site_id = site_id, **{field: pk}).update(post_count = F('post_count') + delta)
+
+	# The taxonomy registry holds the counters as well
+	invalidate('taxonomy')
+
+# Add delta to the post counter of a site
+def change_site_post_count(site_id, delta):
+
+	from blogengine.models import SitePostCount
+
+	if SitePostCount.objects.filter(site_id = site_id).update(post_count = F('post_count') + delta):
+		return
+
+	# First post of the site, unless another process just created the counter
+	try:
+		with transaction.atomic():
+			SitePostCount.objects.create(site_id = site_id, post_count = max(delta, 0))
+	except IntegrityError:
+		SitePostCount.objects.filter(site_id = site_id).update(post_count = F('post_count') + delta)
+
+# Get the number of posts of a site, or of all sites
+def get_site_post_count(site_id = None):
+
+	from blogengine.models import SitePostCount
+
+	if site_id is None:
+		return SitePostCount.objects.aggregate(total = Sum('post_count'))['total'] or 0
+
+	return SitePostCount.objects.filter(site_id = site_id).values_list('post_count', flat = True).first() or 0
+
+# Get the number of posts of a category or tag on a site, from the counters held by the taxonomy registry
+def get_taxonomy_post_count(instance, site_id):
+	return taxonomy.get_post_count(instance, site_id)
+
+# Recompute every counter from the posts
+def repair_post_counts():
+
+	from blogengine.models import Category, Tag, Post, SitePostCount, SiteCategoryCount, SiteTagCount
+
+	invalidate('taxonomy')
+
+	for category in Category.objects.annotate(count = Count('post')):
+		Category.objects.filter(pk = category.pk).update(post_count = category.count)
+
+	for tag in Tag.objects.annotate(count = Count('post')):
+		Tag.objects.filter(pk = tag.pk).update(post_count = tag.count)
+
+	SitePostCount.objects.all().delete()
+	SitePostCount.objects.bulk_create([SitePostCount(site_id = row['site'], post_count = row['count'])
+		for row in Post.objects.order_by().values('site').annotate(count = Count('pk'))])
+
+	SiteCategoryCount.objects.all().delete()
+	SiteCategoryCount.objects.bulk_create([SiteCategoryCount(site_id = row['site'], category_id = row['category'], post_count = row['count'])
+		for row in Post.objects.order_by().filter(category__isnull = False).values('site', 'category').annotate(count = Count('pk'))])
+
+	SiteTagCount.objects.all().delete()
+	SiteTagCount.objects.bulk_create([SiteTagCount(site_id = row['site'], tag_id = row['tags'], post_count = row['count'])
+		for row in Post.objects.order_by().filter(tags__isnull = False).values('site', 'tags').annotate(count = Count('pk'))])
@@ -0,0 +1,157 @@
+import re
+
+from contextlib import contextmanager
+from django.db import connection, transaction
+from django.db.backends.utils import CursorWrapper
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import resolve
+
+# Runs one URL of every view with the caches switched off, and asks the
+# database how it plans each query on the tables that grow with the number of
+# posts. A plan that scans such a table or sorts its rows is reported.
+
+# Tables whose rows grow with the number of posts
+CHECKED_TABLES = ('blogengine_post', 'blogengine_post_tags', 'blogengine_searchterm')
+
+# Views listing the posts of one tag. The tags through table has no pub_date to
+# order by, so those posts are found through its tag index and then sorted.
+# The sort is bounded by the number of posts of the tag. Search results are
+# sorted by a score computed per query, over the posts matching every term.
+BOUNDED_SORT_VIEWS = ('tag', 'tag_feed', 'search')
+
+SQLITE_SCAN_RE = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$')
+SQLITE_SORT_RE = re.compile(r'USE TEMP B-TREE FOR (?:.* )?ORDER BY')
+SQLITE_GROUP_RE = re.compile(r'USE TEMP B-TREE FOR (?:GROUP BY|DISTINCT)')
+POSTGRESQL_SCAN_RE = re.compile(r'Seq Scan on (\w+)')
+POSTGRESQL_SORT_RE = re.compile(r'(?:^|->)\s*(?:Incremental )?Sort\b')
+POSTGRESQL_GROUP_RE = re.compile(r'Aggregate|Unique')
+
+# Record the SQL and parameters of every query run inside the block
+@contextmanager
+def record_queries():
+
+	queries = []
+
+	class RecordingCursorWrapper(CursorWrapper):
+
+		def execute(self, sql, params = None):
+			queries.append((sql, params))
+			return super(RecordingCursorWrapper, self).execute(sql, params)
+
+	force_debug_cursor = connection.force_debug_cursor
+	connection.force_debug_cursor = True
+	connection.make_debug_cursor = lambda cursor: RecordingCursorWrapper(cursor, connection)
+
+	try:
+		yield queries
+	finally:
+		connection.force_debug_cursor = force_debug_cursor
+		del connection.make_debug_cursor
+
+# Get the query plan of a statement, one line per step
+def explain(sql, params):
+
+	with connection.cursor() as cursor:
+		if connection.vendor == 'sqlite':
+			cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+			return [row[-1] for row in cursor.fetchall()]
+
+		if connection.vendor == 'postgresql':
+
+			# Small tables are cheaper to scan, so make the planner show the index it would use on a large one
+			with transaction.atomic():
+				cursor.execute('SET LOCAL enable_seqscan = off')
+				cursor.execute('EXPLAIN ' + sql, params)
+				return [row[0] for row in cursor.fetchall()]
+
+	raise NotImplementedError('Query plans are only checked on SQLite and PostgreSQL')
+
+# Get the problems of a query plan: scans of the checked tables, and sorts of their rows.
+# Sorting the groups of an aggregate or distinct query is not a problem, as there are few of them.
+def get_plan_problems(plan, allow_sort = False):
+
+	if connection.vendor == 'sqlite':
+		scan_re, sort_re, group_re = SQLITE_SCAN_RE, SQLITE_SORT_RE, SQLITE_GROUP_RE
+	else:
+		scan_re, sort_re, group_re = POSTGRESQL_SCAN_RE, POSTGRESQL_SORT_RE, POSTGRESQL_GROUP_RE
+
+	grouped = any(group_re.search(line) for line in plan)
+	problems = []
+
+	for line in plan:
+		scan = scan_re.search(line.strip())
+
+		if scan and scan.group(1) in CHECKED_TABLES:
+			problems.append('scan of {0}'.format(scan.group(1)))
+		elif sort_re.search(line.strip()) and not grouped and not allow_sort:
+			problems.append('sort')
+
+	return problems
+
+# Get one URL of every view, keyed by URL name. Only a few rows are read, so this stays cheap on a large site.
+def get_view_urls():
+
+	from django.contrib.flatpages.models import FlatPage
+	from django.contrib.sites.models import Site
+	from django.urls import reverse
+	from blogengine.models import Category, Tag, Post
+
+	urls = {
+		'index': reverse('blogengine:index'),
+		'post_archive': reverse('blogengine:post_archive'),
+		'posts_feed': reverse('blogengine:posts_feed'),
+		'sitemap': reverse('blogengine:sitemap'),
+		'sitemap_section': reverse('blogengine:sitemap_section', kwargs = {'section': 'posts'}),
+	}
+
+	post = Post.objects.only('title', 'slug', 'pub_date').first()
+
+	if post is not None:
+		urls['post'] = post.get_absolute_url()
+		urls['post_archive_month'] = reverse('blogengine:post_archive_month',
+			kwargs = {'year': post.pub_date.year, 'month': '{0:02d}'.format(post.pub_date.month)})
+		urls['search'] = '/search?q={0}'.format(post.title.split()[0])
+
+	# The category and tag with the most posts
+	category = Category.objects.order_by('-post_count').only('slug').first()
+
+	if category is not None:
+		urls['category'] = reverse('blogengine:category', kwargs = {'slug': category.slug})
+		urls['category_feed'] = reverse('blogengine:category_feed', kwargs = {'slug': category.slug})
+
+	tag = Tag.objects.order_by('-post_count').only('slug').first()
+
+	if tag is not None:
+		urls['tag'] = reverse('blogengine:tag', kwargs = {'slug': tag.slug})
+		urls['tag_feed'] = reverse('blogengine:tag_feed', kwargs = {'slug': tag.slug})
+
+	flatpage = FlatPage.objects.filter(sites = Site.objects.get_current(), registration_required = False).order_by('url').first()
+
+	if flatpage is not None:
+		urls[resolve(flatpage.url).url_name] = flatpage.url
+
+	return urls
+
+# Check the queries of one URL of every view, returning a report per URL name
+def explain_views():
+
+	report = {}
+	dummy_caches = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+	for name, url in sorted(get_view_urls().items()):
+		with override_settings(CACHES = dummy_caches), record_queries() as queries:
+			response = Client().get(url)
+
+		checked = []
+
+		for sql, params in queries:
+			if not sql.lstrip().upper().startswith('SELECT') or not any(table in sql for table in CHECKED_TABLES):
+				continue
+
+			plan = explain(sql, params)
+			checked.append({'sql': sql, 'plan': plan, 'problems': get_plan_problems(plan, allow_sort = name in BOUNDED_SORT_VIEWS)})
+
+		report[name] = {'url': url, 'status': response.status_code, 'queries': checked}
+
+	return report
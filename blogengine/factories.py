@@ -0,0 +1,100 @@
+import factory.django
+
+from django.contrib.auth.models import User
+from django.contrib.flatpages.models import FlatPage
+from django.contrib.sites.models import Site
+from django.utils import timezone
+from blogengine.models import Post, Category, Tag
+
+# Factories
+class SiteFactory(factory.django.DjangoModelFactory):
+
+	class Meta:
+
+		model = Site
+		django_get_or_create = (
+			'name',
+			'domain'
+		)
+
+	name = 'example.com'
+	domain = 'example.com'
+
+class CategoryFactory(factory.django.DjangoModelFactory):
+
+	class Meta:
+
+		model = Category
+		django_get_or_create = (
+			'name',
+			'description',
+			'slug'
+		)
+
+	name = 'Data Science - Test'
+	description = 'Test: Data Science is an interdisciplinary field about processes and systems to extract knowledge or insights from data in various forms.'
+	slug = 'data-science-test'
+
+class TagFactory(factory.django.DjangoModelFactory):
+
+	class Meta:
+
+		model = Tag
+		django_get_or_create = (
+			'name',
+			'description',
+			'slug'
+		)
+
+	name = 'R'
+	description = 'The R programming language'
+	slug = 'r'
+
+class AuthorFactory(factory.django.DjangoModelFactory):
+
+	class Meta:
+
+		model = User
+		django_get_or_create = (
+			'username',
+			'email',
+			'password'
+		)
+
+	username = 'TestUser'
+	email = 'test@user.com'
+	password = 'password'
+
+class FlatPageFactory(factory.django.DjangoModelFactory):
+
+	class Meta:
+
+		model = FlatPage
+		django_get_or_create = (
+			'url',
+			'title',
+			'content'
+		)
+
+	url = '/about/'
+	title = 'Test flat page about me'
+	content = 'Here is all my information.'
+
+class PostFactory(factory.django.DjangoModelFactory):
+
+	class Meta:
+		model = Post
+		django_get_or_create = (
+			'title',
+			'text',
+			'slug',
+			'pub_date'
+		)
+
+	title = 'Test post'
+	text = 'This is a test post for testing.'
+	slug = 'test-post'
+	pub_date = timezone.now()
+	author = factory.SubFactory(AuthorFactory)
+	site = factory.SubFactory(SiteFactory)
+	category = factory.SubFactory(CategoryFactory)
@@ -0,0 +1,96 @@
+import json
+import platform
+import subprocess
+import time
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+from blogengine.benchmark import seed_posts, benchmark_urls
+
+# Cache backends the benchmark can run with
+CACHES = {
+	'locmem': {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+	'dummy': {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+}
+
+# Get the commit of the working tree, if it is a git checkout
+def get_commit():
+
+	try:
+		return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd = settings.BASE_DIR,
+			stderr = subprocess.DEVNULL).decode().strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+class Command(BaseCommand):
+
+	help = 'Seed a throwaway database with a synthetic corpus and measure the latency, queries and response size of every route'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--posts', type = int, action = 'append', default = None,
+			help = 'Number of posts to benchmark with, can be repeated (defaults to 10000, 100000 and 1000000)')
+		parser.add_argument('--requests', type = int, default = 20,
+			help = 'Number of timed requests per URL, after a first cold request')
+		parser.add_argument('--cache', choices = ['locmem', 'dummy', 'configured'], default = 'locmem',
+			help = 'Cache backend to run with: a local memory cache, no cache, or the CACHES setting')
+		parser.add_argument('--output', default = None,
+			help = 'Write the results as JSON to this file instead of standard output')
+		parser.add_argument('--keepdb', action = 'store_true', default = False,
+			help = 'Keep the seeded database between runs, so larger corpora only add the missing posts')
+
+	def handle(self, *args, **options):
+
+		totals = sorted(options['posts'] or [10000, 100000, 1000000])
+		caches = settings.CACHES if options['cache'] == 'configured' else CACHES[options['cache']]
+		verbosity = options['verbosity']
+
+		# An in-memory SQLite database cannot be kept
+		test_settings = connection.settings_dict['TEST']
+
+		if options['keepdb'] and connection.vendor == 'sqlite' and not test_settings.get('NAME'):
+			test_settings['NAME'] = 'benchmark.sqlite3'
+
+		old_name = connection.settings_dict['NAME']
+		connection.creation.create_test_db(verbosity = verbosity, autoclobber = True, serialize = False, keepdb = options['keepdb'])
+
+		report = {
+			'commit': get_commit(),
+			'django': django.get_version(),
+			'python': platform.python_version(),
+			'database': connection.vendor,
+			'cache': options['cache'],
+			'requests': options['requests'],
+			'runs': [],
+		}
+
+		# Pre-rendering is switched off, so every request reaches the views
+		try:
+			with override_settings(CACHES = caches, PRERENDER_ROOT = None, DEBUG = False, ALLOWED_HOSTS = ['*']):
+				for total in totals:
+					start = time.perf_counter()
+					seeded = seed_posts(total, stdout = self.stdout if verbosity > 1 else None)
+					seconds = time.perf_counter() - start
+
+					self.stderr.write('Benchmarking {0} posts'.format(total))
+
+					report['runs'].append({
+						'posts': total,
+						'seeded': seeded,
+						'seed_seconds': round(seconds, 3),
+						'urls': benchmark_urls(options['requests']),
+					})
+		finally:
+			connection.creation.destroy_test_db(old_name, verbosity, keepdb = options['keepdb'])
+
+		output = json.dumps(report, indent = 2, sort_keys = True)
+
+		if options['output']:
+			with open(options['output'], 'w') as output_file:
+				output_file.write(output + '\n')
+
+			self.stdout.write(self.style.SUCCESS('Wrote the results to {0}'.format(options['output'])))
+		else:
+			self.stdout.write(output)
@@ -0,0 +1,39 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from blogengine.explain import explain_views
+
+class Command(BaseCommand):
+
+	help = 'Check that the queries of every view use an index instead of scanning or sorting the post tables'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--json', action = 'store_true', default = False,
+			help = 'Write the full report, with every query plan, as JSON')
+		parser.add_argument('--verbose-plans', action = 'store_true', default = False,
+			help = 'Print the plan of every checked query')
+
+	def handle(self, *args, **options):
+
+		report = explain_views()
+		failed = [name for name, view in report.items() if any(query['problems'] for query in view['queries'])]
+
+		if options['json']:
+			self.stdout.write(json.dumps(report, indent = 2, sort_keys = True))
+		else:
+			for name, view in sorted(report.items()):
+				style = self.style.ERROR if name in failed else self.style.SUCCESS
+				self.stdout.write(style('{0} {1} ({2} queries checked)'.format(name, view['url'], len(view['queries']))))
+
+				for query in view['queries']:
+					if query['problems'] or options['verbose_plans']:
+						self.stdout.write('  {0}'.format(query['sql']))
+
+						for line in query['plan']:
+							self.stdout.write('    {0}'.format(line))
+
+						for problem in query['problems']:
+							self.stdout.write(self.style.ERROR('    -> {0}'.format(problem)))
+
+		if failed:
+			raise CommandError('Queries of {0} do not use an index'.format(', '.join(sorted(failed))))
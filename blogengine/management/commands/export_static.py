@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+from blogengine.prerender import is_enabled, get_prerender_root, get_public_urls, export_site, prune
+
+class Command(BaseCommand):
+
+	help = 'Render every public URL of the blog to static files under PRERENDER_ROOT'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--root', default = None,
+			help = 'Output directory (defaults to PRERENDER_ROOT)')
+		parser.add_argument('--workers', type = int, default = None,
+			help = 'Number of worker processes (defaults to the number of CPUs)')
+		parser.add_argument('--secure', action = 'store_true', default = None,
+			help = 'Render the pages as if they were requested over HTTPS (defaults to PRERENDER_SECURE)')
+		parser.add_argument('--keep', action = 'store_true', default = False,
+			help = 'Keep files in the output directory that are not part of this export')
+
+	def handle(self, *args, **options):
+
+		root = options['root'] or get_prerender_root()
+
+		if not root:
+			raise CommandError('Set PRERENDER_ROOT or pass --root')
+
+		if not is_enabled():
+			raise CommandError('Set SITE_ID to the site to pre-render')
+
+		urls = get_public_urls()
+
+		self.stdout.write('Rendering {0} URLs to {1}'.format(len(urls), root))
+
+		paths = export_site(root, urls, workers = options['workers'], secure = options['secure'])
+
+		for url, path in zip(urls, paths):
+			if path is None:
+				self.stdout.write(self.style.WARNING('Skipped {0}'.format(url)))
+
+		paths = [path for path in paths if path is not None]
+		removed = 0 if options['keep'] else prune(root, paths)
+
+		self.stdout.write(self.style.SUCCESS('Done, wrote {0} files and removed {1}'.format(len(paths), removed)))
@@ -0,0 +1,82 @@
+from multiprocessing import Pool
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from blogengine.cache import invalidate
+from blogengine.markup import render_markdown, render_excerpt
+from blogengine.models import Category, Tag, Post
+from blogengine.prerender import rebuild_runner
+
+# Render the text and excerpt of a single (pk, text, summary) row. Runs in the worker processes, so it must not touch the database.
+def render_row(row):
+
+	pk, text, summary = row
+	html = render_markdown(text)
+
+	return (pk, html) + render_excerpt(text, summary, html)
+
+# Read the posts in primary key order, one chunk of (pk, text, summary) rows at a time
+def get_chunks(chunk_size):
+
+	last_pk = 0
+
+	while True:
+		chunk = list(Post.objects.filter(pk__gt = last_pk).order_by('pk').values_list('pk', 'text', 'summary')[:chunk_size])
+
+		if not chunk:
+			return
+
+		yield chunk
+		last_pk = chunk[-1][0]
+
+class Command(BaseCommand):
+
+	help = 'Re-render the stored HTML and excerpt of every post, e.g. after changing MARKDOWN_EXTRAS or EXCERPT_WORDS'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--chunk-size', type = int, default = 500,
+			help = 'Number of posts rendered and written per batch')
+		parser.add_argument('--workers', type = int, default = None,
+			help = 'Number of worker processes (defaults to the number of CPUs)')
+
+	def handle(self, *args, **options):
+
+		workers = options['workers']
+		pool = Pool(workers) if workers != 1 else None
+		total = 0
+
+		# Read and write from this process only, render each chunk in the workers
+		try:
+			for chunk in get_chunks(options['chunk_size']):
+
+				if pool is None:
+					rendered = [render_row(row) for row in chunk]
+				else:
+					rendered = pool.map(render_row, chunk)
+
+				# Use update() so saving does not re-render or fire the post_save signals.
+				# Bumping the modification time replaces the cached cards and the validators of the pages.
+				with transaction.atomic():
+					now = timezone.now()
+
+					for pk, html, excerpt, has_more in rendered:
+						Post.objects.filter(pk = pk).update(rendered_text = html, excerpt = excerpt, has_more = has_more, modified = now)
+
+				total += len(rendered)
+				self.stdout.write('Rendered {0} posts'.format(total))
+
+		finally:
+			if pool is not None:
+				pool.close()
+				pool.join()
+
+		# Every HTML page depends on the layout, and every feed on the posts or its category or tag
+		if total:
+			invalidate('layout', 'posts', *(['category:{0}'.format(slug) for slug in Category.objects.values_list('slug', flat = True)] +
+				['tag:{0}'.format(slug) for slug in Tag.objects.values_list('slug', flat = True)]))
+
+			# Pages are re-rendered in a background thread, which would not outlive the command
+			rebuild_runner.wait()
+
+		self.stdout.write(self.style.SUCCESS('Done, rendered {0} posts'.format(total)))
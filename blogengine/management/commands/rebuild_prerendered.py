@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+from blogengine.prerender import is_enabled, get_prerender_root, rebuild_runner
+
+class Command(BaseCommand):
+
+	help = 'Re-render the pre-rendered pages affected by the queued changes of content'
+
+	def handle(self, *args, **options):
+
+		root = get_prerender_root()
+
+		if not root:
+			raise CommandError('Set PRERENDER_ROOT')
+
+		if not is_enabled():
+			raise CommandError('Set SITE_ID to the site to pre-render')
+
+		total = rebuild_runner.rebuild(root)
+
+		self.stdout.write(self.style.SUCCESS('Done, rebuilt the pages of {0} changes'.format(total)))
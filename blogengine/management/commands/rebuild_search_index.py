@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from blogengine.models import Post
+from blogengine.search import index_post
+
+class Command(BaseCommand):
+
+	help = 'Rebuild the search index entries of every post'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--chunk-size', type = int, default = 500,
+			help = 'Number of posts read per query')
+
+	def handle(self, *args, **options):
+
+		last_pk = 0
+		total = 0
+
+		# Read the posts in primary key order, one chunk at a time
+		while True:
+			chunk = list(Post.objects.filter(pk__gt = last_pk).order_by('pk').only('pk', 'title', 'text')[:options['chunk_size']])
+
+			if not chunk:
+				break
+
+			for post in chunk:
+				index_post(post)
+
+			total += len(chunk)
+			last_pk = chunk[-1].pk
+			self.stdout.write('Indexed {0} posts'.format(total))
+
+		self.stdout.write(self.style.SUCCESS('Done, indexed {0} posts'.format(total)))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from blogengine.counters import repair_post_counts
+
+class Command(BaseCommand):
+
+	help = 'Recompute the post counters of every category, tag and site'
+
+	def handle(self, *args, **options):
+
+		with transaction.atomic():
+			repair_post_counts()
+
+		self.stdout.write(self.style.SUCCESS('Post counters repaired'))
@@ -0,0 +1,129 @@
+import hashlib
+import threading
+import markdown2
+
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.encoding import force_bytes, force_text
+from django.utils.text import Truncator
+from blogengine.timing import timed, timed_cache
+
+# Extras passed to markdown2, overridable through settings
+def get_markdown_extras():
+	return list(getattr(settings, 'MARKDOWN_EXTRAS', ['fenced-code-blocks']))
+
+# Render markdown text to HTML
+def render_markdown(value, extras = None):
+
+	if extras is None:
+		extras = get_markdown_extras()
+
+	with timed('markdown'):
+		return markdown2.markdown(force_text(value), extras = extras)
+
+# Marker ending the excerpt of a post, when it has no summary
+MORE_MARKER = '<!-- more -->'
+
+# Number of words in the excerpt of a post with neither a summary nor a marker
+def get_excerpt_words():
+	return getattr(settings, 'EXCERPT_WORDS', 100)
+
+# Render the excerpt of a post as HTML: its summary, the text before the marker, or the first words of the
+# rendered text. Returns the excerpt and whether it leaves out part of the post.
+def render_excerpt(text, summary = '', rendered_text = None):
+
+	text = force_text(text)
+
+	if summary:
+		return render_markdown(summary), True
+
+	if MORE_MARKER in text:
+		return render_markdown(text.split(MORE_MARKER, 1)[0]), True
+
+	if rendered_text is None:
+		rendered_text = render_markdown(text)
+
+	excerpt = Truncator(rendered_text).words(get_excerpt_words(), html = True, truncate = ' ...')
+
+	return excerpt, excerpt != rendered_text
+
+# Two level memo of rendered markdown, keyed by a hash of the text and the extras.
+# Lookups go to a bounded per-process LRU first and then to the shared Django cache.
+class MarkdownMemo(object):
+
+	key_prefix = 'markdown'
+
+	def __init__(self, size = None, timeout = None, cache_alias = None):
+
+		self.size = size if size is not None else getattr(settings, 'MARKDOWN_MEMO_SIZE', 256)
+		self.timeout = timeout if timeout is not None else getattr(settings, 'MARKDOWN_CACHE_TIMEOUT', 60 * 60 * 24)
+		self.cache_alias = cache_alias or getattr(settings, 'MARKDOWN_CACHE_ALIAS', 'default')
+
+		self.lock = threading.Lock()
+		self.entries = OrderedDict()
+		self.reset_stats()
+
+	def reset_stats(self):
+		self.stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0, 'evictions': 0}
+
+	def clear(self):
+
+		with self.lock:
+			self.entries.clear()
+
+	def get_key(self, value, extras):
+
+		digest = hashlib.sha1()
+		digest.update(force_bytes('\n'.join(extras)))
+		digest.update(b'\0')
+		digest.update(force_bytes(value))
+
+		return '{0}:{1}'.format(self.key_prefix, digest.hexdigest())
+
+	def remember(self, key, html):
+
+		with self.lock:
+			self.entries[key] = html
+			self.entries.move_to_end(key)
+
+			while len(self.entries) > self.size:
+				self.entries.popitem(last = False)
+				self.stats['evictions'] += 1
+
+	def render(self, value, extras = None):
+
+		if extras is None:
+			extras = get_markdown_extras()
+
+		value = force_text(value)
+		key = self.get_key(value, extras)
+
+		# Per-process LRU
+		with self.lock:
+			html = self.entries.get(key)
+
+			if html is not None:
+				self.entries.move_to_end(key)
+				self.stats['local_hits'] += 1
+				return html
+
+		# Shared cache
+		shared = timed_cache(caches[self.cache_alias])
+		html = shared.get(key)
+
+		if html is None:
+			html = render_markdown(value, extras)
+			shared.set(key, html, self.timeout)
+			counter = 'misses'
+		else:
+			counter = 'shared_hits'
+
+		with self.lock:
+			self.stats[counter] += 1
+
+		self.remember(key, html)
+
+		return html
+
+markdown_memo = MarkdownMemo()
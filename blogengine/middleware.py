@@ -0,0 +1,96 @@
+import json
+import logging
+
+from django.conf import settings
+from django.utils.cache import get_max_age, patch_response_headers
+from blogengine.cache import get_request_tags, get_url_key, get_entry, set_entry, get_versions, release_entry
+from blogengine.prerender import is_prerender_request
+from blogengine.timing import collect_timing
+
+timing_logger = logging.getLogger('blogengine.timing')
+
+class ServerTimingMiddleware(object):
+
+	"""
+	Reports the time spent on database queries, markdown, templates, the cache
+	and feeds in a Server-Timing header, and optionally as a JSON log line
+	"""
+
+	def __init__(self, get_response):
+		self.get_response = get_response
+
+	def __call__(self, request):
+
+		if not getattr(settings, 'SERVER_TIMING', True) and not getattr(settings, 'SERVER_TIMING_LOG', False):
+			return self.get_response(request)
+
+		with collect_timing() as timing:
+			response = self.get_response(request)
+
+		if getattr(settings, 'SERVER_TIMING', True):
+			response['Server-Timing'] = timing.get_header()
+
+		if getattr(settings, 'SERVER_TIMING_LOG', False):
+			report = dict(timing.get_report(), method = request.method, path = request.path, status = response.status_code)
+			timing_logger.info(json.dumps(report, sort_keys = True))
+
+		return response
+
+class DependencyCacheMiddleware(object):
+
+	"""
+	Per-site cache of anonymous GET requests, where every page is tagged with
+	the content it depends on and is invalidated when that content changes.
+	It comes before the session and authentication middleware, so a hit is
+	served with a single cache round trip. Requests with a session cookie,
+	such as those of logged in admin users, are never served from the cache.
+	"""
+
+	def __init__(self, get_response):
+		self.get_response = get_response
+		self.cache_timeout = settings.CACHE_MIDDLEWARE_SECONDS
+		self.key_prefix = settings.CACHE_MIDDLEWARE_KEY_PREFIX
+
+	def __call__(self, request):
+
+		if request.method not in ('GET', 'HEAD') or settings.SESSION_COOKIE_NAME in request.COOKIES:
+			return self.get_response(request)
+
+		# Pre-rendered pages hold includes in place of some parts, so they are not kept with the pages served by Django
+		if is_prerender_request(request):
+			return self.get_response(request)
+
+		tags = get_request_tags(request)
+
+		if tags is None:
+			return self.get_response(request)
+
+		# Serve the cached page if none of its tags has changed, or the old page while another process renders it
+		key = get_url_key('page', request, self.key_prefix)
+		response = get_entry(key, tags)
+
+		if response is not None:
+			return response
+
+		# Read the versions before rendering, so changes made meanwhile invalidate the new entry
+		versions = get_versions(tags)
+
+		try:
+			response = self.get_response(request)
+
+			if request.method == 'GET' and self.should_cache(response):
+				timeout = get_max_age(response)
+
+				if timeout is None:
+					timeout = self.cache_timeout
+
+				if timeout:
+					patch_response_headers(response, timeout)
+					set_entry(key, versions, response, timeout)
+		finally:
+			release_entry(key)
+
+		return response
+
+	def should_cache(self, response):
+		return response.status_code == 200 and not response.streaming and not response.cookies
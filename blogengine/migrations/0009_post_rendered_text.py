@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.4 on 2026-10-18 05:55
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+from blogengine.markup import render_markdown
+
+
+def render_posts(apps, schema_editor):
+    Post = apps.get_model('blogengine', 'Post')
+
+    for post in Post.objects.only('id', 'text').iterator():
+        Post.objects.filter(pk=post.pk).update(rendered_text=render_markdown(post.text))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogengine', '0008_auto_20160118_2148'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='rendered_text',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.RunPython(render_posts, migrations.RunPython.noop),
+    ]
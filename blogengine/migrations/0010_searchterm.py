@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.4 on 2026-10-18 05:59
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from blogengine.search import get_term_weights
+
+
+def index_posts(apps, schema_editor):
+    Post = apps.get_model('blogengine', 'Post')
+    SearchTerm = apps.get_model('blogengine', 'SearchTerm')
+
+    for post in Post.objects.only('id', 'title', 'text').iterator():
+        SearchTerm.objects.bulk_create([SearchTerm(post=post, term=term, weight=weight)
+            for term, weight in get_term_weights(post.title, post.text).items()])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogengine', '0009_post_rendered_text'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=40)),
+                ('weight', models.PositiveIntegerField()),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='blogengine.Post')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='searchterm',
+            unique_together=set([('term', 'post')]),
+        ),
+        migrations.RunPython(index_posts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.4 on 2026-10-18 06:02
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def count_posts(apps, schema_editor):
+    Category = apps.get_model('blogengine', 'Category')
+    Tag = apps.get_model('blogengine', 'Tag')
+    Post = apps.get_model('blogengine', 'Post')
+    SitePostCount = apps.get_model('blogengine', 'SitePostCount')
+
+    for category in Category.objects.annotate(count=models.Count('post')):
+        Category.objects.filter(pk=category.pk).update(post_count=category.count)
+
+    for tag in Tag.objects.annotate(count=models.Count('post')):
+        Tag.objects.filter(pk=tag.pk).update(post_count=tag.count)
+
+    for row in Post.objects.order_by().values('site').annotate(count=models.Count('pk')):
+        SitePostCount.objects.create(site_id=row['site'], post_count=row['count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sites', '0002_alter_domain_unique'),
+        ('blogengine', '0010_searchterm'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SitePostCount',
+            fields=[
+                ('site', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='sites.Site')),
+                ('post_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='post_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='post_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_posts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.4 on 2026-10-18 06:13
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def set_post_modified(apps, schema_editor):
+    Post = apps.get_model('blogengine', 'Post')
+    Post.objects.update(modified=models.F('pub_date'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogengine', '0011_post_counts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='modified',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='modified',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='modified',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(set_post_modified, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.4 on 2026-10-18 06:19
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sites', '0002_alter_domain_unique'),
+        ('blogengine', '0012_modified'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='post',
+            name='modified',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AlterIndexTogether(
+            name='post',
+            index_together=set([('category', 'pub_date'), ('site', 'pub_date'), ('pub_date', 'id')]),
+        ),
+    ]
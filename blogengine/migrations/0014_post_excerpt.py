@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.4 on 2026-10-18 06:21
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+from blogengine.markup import render_excerpt
+
+
+def render_excerpts(apps, schema_editor):
+    Post = apps.get_model('blogengine', 'Post')
+
+    for post in Post.objects.only('id', 'text', 'rendered_text').iterator():
+        excerpt, has_more = render_excerpt(post.text, rendered_text=post.rendered_text)
+        Post.objects.filter(pk=post.pk).update(excerpt=excerpt, has_more=has_more)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogengine', '0013_post_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='excerpt',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='has_more',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='summary',
+            field=models.TextField(blank=True, help_text='Shown in listings and feeds instead of the start of the text'),
+        ),
+        migrations.RunPython(render_excerpts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.4 on 2026-10-18 06:36
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sites', '0002_alter_domain_unique'),
+        ('blogengine', '0014_post_excerpt'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='post',
+            name='modified',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AlterIndexTogether(
+            name='post',
+            index_together=set([('site', 'category', 'pub_date'), ('site', 'modified'), ('pub_date', 'id'), ('site', 'pub_date', 'id')]),
+        ),
+    ]
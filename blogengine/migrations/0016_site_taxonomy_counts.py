@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.4 on 2026-10-18 07:16
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def count_site_posts(apps, schema_editor):
+    Post = apps.get_model('blogengine', 'Post')
+    SiteCategoryCount = apps.get_model('blogengine', 'SiteCategoryCount')
+    SiteTagCount = apps.get_model('blogengine', 'SiteTagCount')
+
+    for row in Post.objects.order_by().filter(category__isnull=False).values('site', 'category').annotate(count=models.Count('pk')):
+        SiteCategoryCount.objects.create(site_id=row['site'], category_id=row['category'], post_count=row['count'])
+
+    for row in Post.objects.order_by().filter(tags__isnull=False).values('site', 'tags').annotate(count=models.Count('pk')):
+        SiteTagCount.objects.create(site_id=row['site'], tag_id=row['tags'], post_count=row['count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sites', '0002_alter_domain_unique'),
+        ('blogengine', '0015_post_site_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SiteCategoryCount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('post_count', models.PositiveIntegerField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='site_counts', to='blogengine.Category')),
+                ('site', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='sites.Site')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SiteTagCount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('post_count', models.PositiveIntegerField(default=0)),
+                ('site', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='sites.Site')),
+                ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='site_counts', to='blogengine.Tag')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='sitetagcount',
+            unique_together=set([('site', 'tag')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='sitecategorycount',
+            unique_together=set([('site', 'category')]),
+        ),
+        migrations.RunPython(count_site_posts, migrations.RunPython.noop),
+    ]
@@ -1,16 +1,58 @@
+from django.conf import settings
 from django.db import models
 from django.contrib.auth.models import User
 from django.contrib.sites.models import Site
+from django.utils import timezone
 from django.utils.text import slugify
-from django.db.models.signals import post_save
-from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
+from django.contrib.flatpages.models import FlatPage
+from blogengine.markup import render_markdown, render_excerpt
+from blogengine.cache import invalidate, get_post_tags, tags_invalidated
+from blogengine.search import index_post
+from blogengine.counters import change_post_count, change_site_post_count, change_site_taxonomy_count
+from blogengine.pagination import encode_position
+
+# Remembers the values an instance was loaded with, so signal handlers can tell what changed on save
+class LoadedValuesMixin(object):
+
+	@classmethod
+	def from_db(cls, db, field_names, values):
+
+		instance = super(LoadedValuesMixin, cls).from_db(db, field_names, values)
+		instance._loaded_values = dict(zip(field_names, values))
+
+		return instance
+
+	def get_loaded_value(self, name):
+		return getattr(self, '_loaded_values', {}).get(name)
+
+	# Once saved, including its signal handlers, the instance holds what is stored
+	def save(self, *args, **kwargs):
+
+		super(LoadedValuesMixin, self).save(*args, **kwargs)
+
+		self._loaded_values = dict((field.attname, getattr(self, field.attname)) for field in self._meta.concrete_fields)
+
+# Leaves the post counter out when saving an existing instance, as the counter
+# is only changed by the signal handlers and the instance may hold a stale value
+class PostCountMixin(object):
+
+	def save(self, *args, **kwargs):
+
+		if not self._state.adding and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+			kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+				if not field.primary_key and field.name != 'post_count']
+
+		super(PostCountMixin, self).save(*args, **kwargs)
 
 # Category model
-class Category(models.Model):
+class Category(LoadedValuesMixin, PostCountMixin, models.Model):
 
 	name = models.CharField(max_length = 200)
 	description = models.TextField()
 	slug = models.SlugField(max_length = 40, unique = True, blank = True, null = True)
+	post_count = models.PositiveIntegerField(default = 0, editable = False)
+	modified = models.DateTimeField(auto_now = True)
 
 	def save(self, *args, **kwargs):
 
@@ -29,11 +71,13 @@ class Category(models.Model):
 		verbose_name_plural = 'categories'
 
 # Tag model
-class Tag(models.Model):
+class Tag(LoadedValuesMixin, PostCountMixin, models.Model):
 
 	name = models.CharField(max_length = 200)
 	description = models.TextField()
 	slug = models.SlugField(max_length = 40, unique = True, blank = True, null = True)
+	post_count = models.PositiveIntegerField(default = 0, editable = False)
+	modified = models.DateTimeField(auto_now = True)
 
 	def save(self, *args, **kwargs):
 
@@ -48,8 +92,19 @@ class Tag(models.Model):
 	def __str__(self):
 		return self.name
 
+# Queryset of blogposts
+class PostQuerySet(models.QuerySet):
+
+	# Load the category, author and tags of every post in a constant number of queries
+	def with_relations(self):
+		return self.select_related('category', 'author').prefetch_related('tags')
+
+	# Posts of a site, given the site or its id. Every listing index leads with the site.
+	def for_site(self, site):
+		return self.filter(site = site)
+
 # Blogpost model
-class Post(models.Model):
+class Post(LoadedValuesMixin, models.Model):
 
 	# Model specifications
 	title = models.CharField(max_length = 200)
@@ -58,8 +113,23 @@ class Post(models.Model):
 	tags = models.ManyToManyField(Tag,  blank = True, null = True)
 	pub_date = models.DateTimeField()
 	text = models.TextField()
+	summary = models.TextField(blank = True, help_text = 'Shown in listings and feeds instead of the start of the text')
+	rendered_text = models.TextField(blank = True, editable = False)
+	excerpt = models.TextField(blank = True, editable = False)
+	has_more = models.BooleanField(default = False, editable = False)
 	slug = models.SlugField(max_length = 40, unique = True)
 	site = models.ForeignKey(Site, on_delete = models.CASCADE)
+	modified = models.DateTimeField(auto_now = True)
+
+	objects = PostQuerySet.as_manager()
+
+	# Render the markdown and the excerpt once on save, so views only read the stored HTML
+	def save(self, *args, **kwargs):
+
+		self.rendered_text = render_markdown(self.text)
+		self.excerpt, self.has_more = render_excerpt(self.text, self.summary, self.rendered_text)
+
+		super(Post, self).save(*args, **kwargs)
 
 	# Define url for each post. (Possibly change this to have 0 in front of single number elements.)
 	def get_absolute_url(self):
@@ -71,9 +141,278 @@ class Post(models.Model):
 	class Meta:
 		ordering = ['-pub_date']
 
-# Define signals function
-def new_post(sender, instance, created, **kwargs):
-    cache.clear()
+		# Listings are read newest first, by (pub_date, pk) cursors, within a site and possibly a category.
+		# The admin lists the posts of every site.
+		index_together = [
+			('site', 'pub_date', 'id'),
+			('site', 'category', 'pub_date'),
+			('site', 'modified'),
+			('pub_date', 'id'),
+		]
+
+# Number of posts of a site
+class SitePostCount(models.Model):
+
+	site = models.OneToOneField(Site, primary_key = True, on_delete = models.CASCADE)
+	post_count = models.PositiveIntegerField(default = 0)
+
+	def __str__(self):
+		return '{0}: {1}'.format(self.site, self.post_count)
+
+# Number of posts of a category on a site
+class SiteCategoryCount(models.Model):
+
+	site = models.ForeignKey(Site, on_delete = models.CASCADE)
+	category = models.ForeignKey(Category, related_name = 'site_counts', on_delete = models.CASCADE)
+	post_count = models.PositiveIntegerField(default = 0)
+
+	def __str__(self):
+		return '{0} on {1}: {2}'.format(self.category, self.site, self.post_count)
+
+	class Meta:
+		unique_together = ('site', 'category')
+
+# Number of posts of a tag on a site
+class SiteTagCount(models.Model):
+
+	site = models.ForeignKey(Site, on_delete = models.CASCADE)
+	tag = models.ForeignKey(Tag, related_name = 'site_counts', on_delete = models.CASCADE)
+	post_count = models.PositiveIntegerField(default = 0)
+
+	def __str__(self):
+		return '{0} on {1}: {2}'.format(self.tag, self.site, self.post_count)
+
+	class Meta:
+		unique_together = ('site', 'tag')
+
+# Change of content whose pre-rendered pages have not been rebuilt yet: the dependency tags it bumped, and the
+# JSON list of the changes of posts that bumped them, if known
+class PendingRebuild(models.Model):
+
+	tags = models.TextField()
+	changes = models.TextField(blank = True, null = True)
+	created = models.DateTimeField(auto_now_add = True)
+
+	def __str__(self):
+		return self.tags
+
+# Search index entry: a term occurring in a post, and its weight in that post
+class SearchTerm(models.Model):
+
+	term = models.CharField(max_length = 40)
+	post = models.ForeignKey(Post, related_name = 'search_terms', on_delete = models.CASCADE)
+	weight = models.PositiveIntegerField()
+
+	def __str__(self):
+		return self.term
+
+	class Meta:
+		unique_together = ('term', 'post')
+
+# Get the dependency tags of a post, both as it is now and as it was loaded
+def get_post_change_tags(post):
+
+	tags = get_post_tags(post,
+		category_slug = post.category.slug if post.category_id else None,
+		tag_slugs = post.tags.values_list('slug', flat = True))
+
+	category_id = post.get_loaded_value('category_id')
+
+	if category_id and category_id != post.category_id:
+		category_slug = Category.objects.filter(pk = category_id).values_list('slug', flat = True).first()
+	else:
+		category_slug = None
+
+	if post.get_loaded_value('slug') or post.get_loaded_value('pub_date'):
+		tags += get_post_tags(post,
+			slug = post.get_loaded_value('slug'),
+			pub_date = post.get_loaded_value('pub_date'),
+			category_slug = category_slug)
+
+	return tags
+
+# Describe where a post is listed: its site, its (pub_date, pk) position and the slugs of its category and tags
+def get_post_listing(post, site_id, pub_date, category_slug, tag_slugs):
+	return {'site': site_id, 'position': encode_position(pub_date, post.pk), 'category': category_slug, 'tags': sorted(tag_slugs)}
+
+# Describe where a saved or deleted post was listed before and is listed after the change, None where it is not
+def get_post_change(post, created = False, deleted = False):
+
+	category_slug = post.category.slug if post.category_id else None
+	tag_slugs = list(post.tags.values_list('slug', flat = True))
+	after = None if deleted else get_post_listing(post, post.site_id, post.pub_date, category_slug, tag_slugs)
+
+	if created:
+		return {'before': None, 'after': after}
+
+	category_id = post.get_loaded_value('category_id')
+
+	if category_id != post.category_id:
+		category_slug = Category.objects.filter(pk = category_id).values_list('slug', flat = True).first() if category_id else None
+
+	before = get_post_listing(post, post.get_loaded_value('site_id') or post.site_id,
+		post.get_loaded_value('pub_date') or post.pub_date, category_slug, tag_slugs)
+
+	return {'before': before, 'after': after}
+
+# Describe the changes of posts whose tags with the given slugs were added or removed
+def get_post_tag_changes(posts, slugs, added):
+
+	changes = []
+
+	for post in posts.select_related('category').prefetch_related('tags'):
+		category_slug = post.category.slug if post.category_id else None
+		current = set(tag.slug for tag in post.tags.all())
+		before, after = (current.difference(slugs), current) if added else (current, current.difference(slugs))
+
+		changes.append({
+			'before': get_post_listing(post, post.site_id, post.pub_date, category_slug, before),
+			'after': get_post_listing(post, post.site_id, post.pub_date, category_slug, after),
+		})
+
+	return changes
+
+# Get the dependency tags of a category or tag and of the posts that show it
+def get_taxonomy_change_tags(instance, prefix, posts):
+
+	tags = ['posts', 'taxonomy', 'labels', '{0}:{1}'.format(prefix, instance.slug)]
+
+	if instance.get_loaded_value('slug'):
+		tags.append('{0}:{1}'.format(prefix, instance.get_loaded_value('slug')))
+
+	# The listings of the posts show the label too
+	for slug, pub_date, category_slug, tag_slug in posts.values_list('slug', 'pub_date', 'category__slug', 'tags__slug'):
+		tags += get_post_tags(None, slug = slug, pub_date = pub_date, category_slug = category_slug,
+			tag_slugs = [tag_slug] if tag_slug else [])
+
+	return tags
+
+# Define signals functions
+def post_changed(sender, instance, **kwargs):
+
+	tags = get_post_change_tags(instance)
+
+	# The archive sidebar only changes when a post is published, removed or moved to another date or site
+	if (kwargs.get('created', True) or instance.get_loaded_value('pub_date') != instance.pub_date or
+		instance.get_loaded_value('site_id') != instance.site_id):
+		tags.append('archive')
+
+	# Only saving a post is sent with created
+	change = get_post_change(instance, created = kwargs.get('created', False), deleted = 'created' not in kwargs)
+
+	# The post may have moved from another site
+	invalidate(*tags, sites = [instance.site_id, instance.get_loaded_value('site_id')], changes = [change])
+
+def post_saved(sender, instance, created, **kwargs):
+
+	index_post(instance)
+
+	# Move the post between the counters of its old and new category and site
+	if created:
+		change_post_count(Category, [instance.category_id], 1, instance.site_id)
+		change_site_post_count(instance.site_id, 1)
+		return
+
+	category_id = instance.get_loaded_value('category_id')
+	site_id = instance.get_loaded_value('site_id') or instance.site_id
+
+	if category_id != instance.category_id:
+		change_post_count(Category, [category_id], -1, site_id)
+		change_post_count(Category, [instance.category_id], 1, instance.site_id)
+	elif site_id != instance.site_id:
+		change_site_taxonomy_count(Category, [instance.category_id], -1, site_id)
+		change_site_taxonomy_count(Category, [instance.category_id], 1, instance.site_id)
+
+	if site_id != instance.site_id:
+		tag_ids = list(instance.tags.values_list('pk', flat = True))
+		change_site_taxonomy_count(Tag, tag_ids, -1, site_id)
+		change_site_taxonomy_count(Tag, tag_ids, 1, instance.site_id)
+		change_site_post_count(site_id, -1)
+		change_site_post_count(instance.site_id, 1)
+
+def post_deleted(sender, instance, **kwargs):
+
+	change_post_count(Category, [instance.category_id], -1, instance.site_id)
+	change_post_count(Tag, instance.tags.values_list('pk', flat = True), -1, instance.site_id)
+	change_site_post_count(instance.site_id, -1)
+
+def post_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+
+	# Changing the tags also marks the posts as modified.
+	# Removals are handled before the rows go, so only the rows that actually existed are counted
+	if action == 'post_add':
+		delta = 1
+	elif action in ('pre_remove', 'pre_clear'):
+		delta = -1
+	else:
+		return
+
+	# The instance is a tag when the relation is changed from the tag side
+	if reverse:
+		if action == 'post_add':
+			posts = Post.objects.filter(pk__in = pk_set)
+		elif action == 'pre_remove':
+			posts = instance.post_set.filter(pk__in = pk_set)
+		else:
+			posts = instance.post_set.all()
+
+		changes = get_post_tag_changes(posts, [instance.slug], action == 'post_add')
+		posts = list(posts.values_list('pk', 'slug', 'site'))
+		sites = set(site for pk, slug, site in posts)
+
+		for site_id in sites:
+			change_post_count(Tag, [instance.pk], delta * len([pk for pk, slug, site in posts if site == site_id]), site_id)
+
+		Post.objects.filter(pk__in = [pk for pk, slug, site in posts]).update(modified = timezone.now())
+
+		tags = ['posts', 'tag:{0}'.format(instance.slug)] + ['post:{0}'.format(slug) for pk, slug, site in posts]
+	else:
+		if action == 'post_add':
+			post_tags = Tag.objects.filter(pk__in = pk_set)
+		elif action == 'pre_remove':
+			post_tags = instance.tags.filter(pk__in = pk_set)
+		else:
+			post_tags = instance.tags.all()
+
+		post_tags = list(post_tags.values_list('pk', 'slug'))
+		changes = get_post_tag_changes(Post.objects.filter(pk = instance.pk), [slug for pk, slug in post_tags], action == 'post_add')
+		change_post_count(Tag, [pk for pk, slug in post_tags], delta, instance.site_id)
+		instance.modified = timezone.now()
+		Post.objects.filter(pk = instance.pk).update(modified = instance.modified)
+
+		tags = ['posts', 'post:{0}'.format(instance.slug)] + ['tag:{0}'.format(slug) for pk, slug in post_tags]
+		sites = [instance.site_id]
+
+	invalidate(*tags, sites = sites, changes = changes)
+
+def category_changed(sender, instance, **kwargs):
+	invalidate(*get_taxonomy_change_tags(instance, 'category', Post.objects.filter(category = instance)))
+
+def tag_changed(sender, instance, **kwargs):
+	invalidate(*get_taxonomy_change_tags(instance, 'tag', instance.post_set.all()))
+
+def flatpage_changed(sender, **kwargs):
+	invalidate('layout', 'flatpages')
+
+def content_invalidated(sender, tags, sites, changes = None, **kwargs):
+
+	from blogengine.prerender import rebuild_runner
+
+	# Only the current site is pre-rendered
+	if not sites or getattr(settings, 'SITE_ID', None) in sites:
+		rebuild_runner.schedule(tags, changes)
 
-# Set up signals
-post_save.connect(new_post, sender = Post)
\ No newline at end of file
+# Set up signals. Deletes are handled before the rows go, while the related posts and tags can still be read.
+post_save.connect(post_changed, sender = Post)
+post_save.connect(post_saved, sender = Post)
+pre_delete.connect(post_changed, sender = Post)
+pre_delete.connect(post_deleted, sender = Post)
+m2m_changed.connect(post_tags_changed, sender = Post.tags.through)
+post_save.connect(category_changed, sender = Category)
+pre_delete.connect(category_changed, sender = Category)
+post_save.connect(tag_changed, sender = Tag)
+pre_delete.connect(tag_changed, sender = Tag)
+post_save.connect(flatpage_changed, sender = FlatPage)
+post_delete.connect(flatpage_changed, sender = FlatPage)
+m2m_changed.connect(flatpage_changed, sender = FlatPage.sites.through)
+tags_invalidated.connect(content_invalidated)
@@ -0,0 +1,137 @@
+import calendar
+import datetime
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.http import Http404
+from django.utils import timezone
+
+# Posts are paginated on (pub_date, pk), newest first. A cursor encodes that
+# position as '<microseconds since the epoch>-<pk>', so deep pages are found
+# through the index instead of an OFFSET scan.
+
+ORDERING = ('-pub_date', '-pk')
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+# Encode the position of a post as a cursor
+def encode_cursor(post):
+	return encode_position(post.pub_date, post.pk)
+
+# Encode a (pub_date, pk) position as a cursor
+def encode_position(pub_date, pk):
+
+	if timezone.is_aware(pub_date):
+		pub_date = timezone.make_naive(pub_date, timezone.utc)
+
+	microseconds = calendar.timegm(pub_date.timetuple()) * 1000000 + pub_date.microsecond
+
+	return '{0}-{1}'.format(microseconds, pk)
+
+# Decode a cursor into a (pub_date, pk) pair, raising ValueError if it is malformed
+def decode_cursor(cursor):
+
+	microseconds, pk = cursor.rsplit('-', 1)
+	pub_date = EPOCH + datetime.timedelta(microseconds = int(microseconds))
+
+	if settings.USE_TZ:
+		pub_date = timezone.make_aware(pub_date, timezone.utc)
+
+	return pub_date, int(pk)
+
+# A page of posts found from a cursor, with the same interface as a Django Page where templates use it
+class KeysetPage(object):
+
+	def __init__(self, object_list, has_next, has_previous):
+		self.object_list = object_list
+		self._has_next = has_next
+		self._has_previous = has_previous
+
+	def __len__(self):
+		return len(self.object_list)
+
+	def __iter__(self):
+		return iter(self.object_list)
+
+	def __getitem__(self, index):
+		return self.object_list[index]
+
+	def has_next(self):
+		return self._has_next
+
+	def has_previous(self):
+		return self._has_previous
+
+	def has_other_pages(self):
+		return self._has_next or self._has_previous
+
+# Get the page of posts after or before a cursor
+def paginate_keyset(queryset, per_page, after = None, before = None):
+
+	try:
+		pub_date, pk = decode_cursor(after or before)
+	except (ValueError, OverflowError):
+		raise Http404('Invalid cursor')
+
+	if after:
+		posts = list(queryset.filter(Q(pub_date__lt = pub_date) | Q(pub_date = pub_date, pk__lt = pk))
+			.order_by(*ORDERING)[:per_page + 1])
+
+		return KeysetPage(posts[:per_page], len(posts) > per_page, True)
+
+	# Walk backwards from the cursor, then put the posts back in display order
+	posts = list(queryset.filter(Q(pub_date__gt = pub_date) | Q(pub_date = pub_date, pk__gt = pk))
+		.order_by('pub_date', 'pk')[:per_page + 1])
+
+	return KeysetPage(posts[:per_page][::-1], True, len(posts) > per_page)
+
+# Lets a ListView of posts be paginated by the ?after= and ?before= cursors,
+# while page number URLs keep using the offset paginator
+class KeysetPaginationMixin(object):
+
+	def paginate_queryset(self, queryset, page_size):
+
+		queryset = queryset.order_by(*ORDERING)
+		after = self.request.GET.get('after')
+		before = self.request.GET.get('before')
+
+		if not (after or before):
+			return super(KeysetPaginationMixin, self).paginate_queryset(queryset, page_size)
+
+		page = paginate_keyset(queryset, page_size, after = after, before = before)
+
+		return (None, page, page.object_list, True)
+
+	def get_context_data(self, **kwargs):
+
+		context = super(KeysetPaginationMixin, self).get_context_data(**kwargs)
+		page = context.get('page_obj')
+
+		# Cursors of the pages around this one
+		if page is not None and len(page):
+			context['next_cursor'] = encode_cursor(page[-1]) if page.has_next() else None
+			context['previous_cursor'] = encode_cursor(page[0]) if page.has_previous() else None
+
+		return context
+
+# Paginator that is given the number of objects instead of counting them
+class CountedPaginator(Paginator):
+
+	def __init__(self, object_list, per_page, count = None, **kwargs):
+
+		super(CountedPaginator, self).__init__(object_list, per_page, **kwargs)
+
+		if count is not None:
+			self.count = count
+
+# Lets a ListView read its number of objects from a counter, through get_object_count()
+class CountedPaginationMixin(object):
+
+	paginator_class = CountedPaginator
+
+	def get_object_count(self):
+		return None
+
+	def get_paginator(self, queryset, per_page, **kwargs):
+		return self.paginator_class(queryset, per_page, count = self.get_object_count(), **kwargs)
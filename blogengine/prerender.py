@@ -0,0 +1,607 @@
+import glob
+import json
+import math
+import os
+import posixpath
+import re
+import tempfile
+import threading
+
+from functools import partial
+from multiprocessing import Pool
+from django.conf import settings
+from django.contrib.flatpages.models import FlatPage
+from django.contrib.sites.models import Site
+from django.db import connection, connections
+from django.db.models import Q
+from django.http import parse_cookie
+from django.core.handlers.base import BaseHandler
+from django.test import RequestFactory
+from django.urls import resolve, reverse
+from django.utils.html import format_html
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+from blogengine.cache import fresh_entries
+from blogengine.counters import get_site_post_count, get_taxonomy_post_count
+from blogengine.models import Category, Tag, Post, PendingRebuild
+from blogengine.pagination import decode_cursor
+from blogengine.sitemap import get_sitemap_urls
+from blogengine.taxonomy import taxonomy
+
+# Public pages are rendered through the full middleware stack and written under
+# PRERENDER_ROOT, one file per URL. A URL without an extension is stored as
+# <path>/index.<ext>, the extension following the content type, so the pages
+# can be served with the right headers without asking Django. The headers of
+# each page, such as Vary and X-Frame-Options, are kept beside it in a JSON
+# file, <file>.headers, and sent back with it.
+#
+# Parts shown on every page that change on their own, such as the archive
+# sidebar, are pre-rendered as separate files and included in the pages with a
+# server side include, so that changing them rewrites one file, not every page.
+
+# Extension of each content type that is pre-rendered, in lookup order
+EXTENSIONS = [
+	('text/html', '.html'),
+	('application/rss+xml', '.rss'),
+	('application/xml', '.xml'),
+]
+
+# Content type served for each extension
+CONTENT_TYPES = {
+	'.html': 'text/html; charset=utf-8',
+	'.rss': 'application/rss+xml; charset=utf-8',
+	'.xml': 'application/xml',
+}
+
+# Key set in the environ of the requests that pre-render a page
+PRERENDER_ENVIRON_KEY = 'blogengine.prerender'
+
+# Include of another pre-rendered file, in the syntax of nginx SSI, so that a front end server can serve the pages too
+INCLUDE_PATTERN = re.compile(rb'<!--# include virtual="([^"]+)" -->')
+
+# Headers left out of the stored headers of a page: the length and validators are those of the
+# served file, and the others only hold for the request that rendered it
+UNSTORED_HEADERS = set(['content-length', 'etag', 'last-modified', 'expires', 'date', 'server-timing'])
+
+# Stored headers also sent with a 304 response
+NOT_MODIFIED_HEADERS = set(['cache-control', 'vary'])
+
+# Number of queued changes rebuilt together
+REBUILD_BATCH_SIZE = 100
+
+def get_prerender_root():
+	return getattr(settings, 'PRERENDER_ROOT', None)
+
+# Only the SITE_ID site is pre-rendered. Without it the site is found from the host of each request, and nothing is.
+def is_enabled():
+	return bool(getattr(settings, 'SITE_ID', None))
+
+def get_host():
+	return Site.objects.get_current().domain
+
+# Whether a request host is the host of the pre-rendered site, ignoring the port
+def is_prerendered_host(host):
+	return is_enabled() and host.lower().split(':')[0] == get_host().lower().split(':')[0]
+
+# Whether a request is pre-rendering its page
+def is_prerender_request(request):
+	return request is not None and bool(request.META.get(PRERENDER_ENVIRON_KEY))
+
+# Get the include of the pre-rendered file of a URL
+def get_include(url):
+	return format_html('<!--# include virtual="{0}" -->', url)
+
+# Get the number of objects on each page of the paginated list view of a URL
+def get_per_page(url):
+	view = resolve(url).func
+	return view.view_initkwargs.get('paginate_by') or view.view_class.paginate_by
+
+# Get the URL of every page of a paginated list view. Given the output root,
+# pre-rendered pages past the last one are included too, so they get removed.
+def get_paged_urls(name, count, root = None, **kwargs):
+
+	url = reverse(name, kwargs = kwargs)
+	per_page = get_per_page(url)
+	urls = [url]
+	page = 2
+
+	while page <= int(math.ceil(count / per_page)) or (root and find_page_file(root, reverse(name, kwargs = dict(kwargs, page = page)))):
+		urls.append(reverse(name, kwargs = dict(kwargs, page = page)))
+		page += 1
+
+	return urls
+
+# Get every public URL of the current site. Search results depend on the query string and are left to Django.
+def get_public_urls():
+
+	from blogengine.urls import sitemaps
+
+	site = Site.objects.get_current()
+	urls = get_paged_urls('blogengine:index', get_site_post_count(site.pk))
+	urls += [post.get_absolute_url() for post in Post.objects.for_site(site).order_by('pk').only('slug', 'pub_date').iterator()]
+
+	for category in Category.objects.order_by('pk').only('slug'):
+		urls += get_paged_urls('blogengine:category', get_taxonomy_post_count(category, site.pk), slug = category.slug)
+		urls.append(reverse('blogengine:category_feed', kwargs = {'slug': category.slug}))
+
+	for tag in Tag.objects.order_by('pk').only('slug'):
+		urls += get_paged_urls('blogengine:tag', get_taxonomy_post_count(tag, site.pk), slug = tag.slug)
+		urls.append(reverse('blogengine:tag_feed', kwargs = {'slug': tag.slug}))
+
+	urls.append(reverse('blogengine:post_archive'))
+	urls.append(reverse('blogengine:archive_fragment'))
+
+	for month in Post.objects.for_site(site).dates('pub_date', 'month'):
+		urls.append(reverse('blogengine:post_archive_month', kwargs = {'year': month.year, 'month': '{0:02d}'.format(month.month)}))
+
+	urls.append(reverse('blogengine:posts_feed'))
+	urls.append(reverse('blogengine:sitemap'))
+	urls += get_sitemap_urls(sitemaps, site)
+
+	urls += FlatPage.objects.filter(sites = site, registration_required = False).order_by('url').values_list('url', flat = True)
+
+	return urls
+
+# Get the path of a page relative to the output root, or None if its content type is not pre-rendered
+def get_file_path(url, content_type):
+
+	path = posixpath.normpath('/' + url).lstrip('/')
+
+	if posixpath.splitext(path)[1] in CONTENT_TYPES:
+		return path
+
+	for prefix, extension in EXTENSIONS:
+		if content_type.startswith(prefix):
+			return posixpath.join(path, 'index' + extension)
+
+	return None
+
+# Get the pre-rendered file of a URL, or None if there is none
+def find_page_file(root, url):
+
+	path = posixpath.normpath('/' + url).lstrip('/')
+	extension = posixpath.splitext(path)[1]
+
+	if extension:
+		candidates = [path] if extension in CONTENT_TYPES else []
+	else:
+		candidates = [posixpath.join(path, 'index' + suffix) for prefix, suffix in EXTENSIONS]
+
+	for candidate in candidates:
+		filename = os.path.join(root, candidate)
+
+		if os.path.isfile(filename):
+			return filename
+
+	return None
+
+# Get the URLs of the pre-rendered directory pages matching a glob pattern relative to root
+def find_page_urls(root, pattern):
+
+	urls = []
+
+	for filename in glob.glob(os.path.join(root, pattern, 'index.*')):
+		directory = os.path.relpath(os.path.dirname(filename), root)
+		urls.append('/{0}/'.format(directory.replace(os.sep, '/')))
+
+	return urls
+
+# Get the path of the file holding the headers of a pre-rendered file
+def get_headers_path(path):
+	return path + '.headers'
+
+# Write a file so that readers see either the old or the new content, never a partial file
+def write_file(path, content):
+
+	directory = os.path.dirname(path)
+	os.makedirs(directory, exist_ok = True)
+	descriptor, temporary = tempfile.mkstemp(dir = directory, prefix = '.')
+
+	try:
+		with os.fdopen(descriptor, 'wb') as output:
+			output.write(content)
+		os.chmod(temporary, 0o644)
+		os.replace(temporary, path)
+	except BaseException:
+		os.remove(temporary)
+		raise
+
+# Handler running requests through the middleware of the project, as the WSGI handler does, loaded once per process
+_handler = None
+
+def get_handler():
+
+	global _handler
+
+	if _handler is None:
+		handler = BaseHandler()
+		handler.load_middleware()
+		_handler = handler
+
+	return _handler
+
+# Render a URL through the full middleware stack, as requested for pre-rendering
+def render_page(url, host, secure = False):
+
+	request = RequestFactory(HTTP_HOST = host).get(url, secure = secure, **{PRERENDER_ENVIRON_KEY: True})
+
+	# Another process may be rebuilding a cached copy of the page, which is then out of date
+	with fresh_entries():
+		response = get_handler().get_response(request)
+		content = b''.join(response.streaming_content) if response.streaming else response.content
+
+	return response, content
+
+# Render a URL and write it under root with its headers. Returns the written path relative to root, or None if the page was not stored.
+def export_page(url, root, host, secure = False):
+
+	response, content = render_page(url, host, secure)
+
+	if response.status_code != 200:
+		return None
+
+	path = get_file_path(url, response['Content-Type'])
+
+	if path is None:
+		return None
+
+	headers = [(name, value) for name, value in response.items() if name.lower() not in UNSTORED_HEADERS]
+	write_file(get_headers_path(os.path.join(root, path)), json.dumps(headers).encode('utf-8'))
+	write_file(os.path.join(root, path), content)
+
+	return path
+
+# Remove the pre-rendered file of a URL and its headers, if there is one
+def remove_page(root, url):
+
+	filename = find_page_file(root, url)
+
+	if filename is not None:
+		os.remove(filename)
+
+		if os.path.isfile(get_headers_path(filename)):
+			os.remove(get_headers_path(filename))
+
+# Render every public URL under root, with a pool of worker processes unless workers is 1.
+# Returns the written path of each URL, None for those that were not stored.
+def export_site(root, urls = None, workers = None, secure = None):
+
+	urls = get_public_urls() if urls is None else urls
+	secure = getattr(settings, 'PRERENDER_SECURE', False) if secure is None else secure
+	export = partial(export_page, root = root, host = get_host(), secure = secure)
+
+	if workers == 1:
+		return [export(url) for url in urls]
+
+	# Forked workers must open their own database connections
+	connections.close_all()
+
+	pool = Pool(workers)
+
+	try:
+		return pool.map(export, urls)
+	finally:
+		pool.close()
+		pool.join()
+
+# Remove the files under root that were not written by the last export, keeping the headers of those that were
+def prune(root, paths):
+
+	paths = set(os.path.normpath(os.path.join(root, path)) for path in paths)
+	paths.update([get_headers_path(path) for path in paths])
+	removed = 0
+
+	for directory, subdirectories, files in os.walk(root, topdown = False):
+		for name in files:
+			path = os.path.join(directory, name)
+
+			if path not in paths:
+				os.remove(path)
+				removed += 1
+
+		if directory != root and not os.listdir(directory):
+			os.rmdir(directory)
+
+	return removed
+
+# WSGI application serving the pre-rendered pages, falling back to Django for everything else.
+# Only anonymous GET and HEAD requests without a query string are answered from the files,
+# with a 304 when the client holds the current copy.
+class PrerenderedApplication(object):
+
+	def __init__(self, application, root = None):
+		self.application = application
+		self.root = root
+
+	def get_root(self):
+		return self.root or get_prerender_root()
+
+	# Get the pre-rendered file of a path, or None if there is none
+	def find_page(self, path):
+
+		root = self.get_root()
+
+		return find_page_file(root, path) if root else None
+
+	# Get the stored headers of a file, or only its content type for files exported without them
+	def read_headers(self, filename):
+
+		try:
+			with open(get_headers_path(filename), 'rb') as source:
+				return [(str(name), str(value)) for name, value in json.loads(source.read().decode('utf-8'))]
+		except FileNotFoundError:
+			return [('Content-Type', CONTENT_TYPES[os.path.splitext(filename)[1]])]
+
+	# Get the content of a file with its includes, and the stat of each file read, or None if an included file is missing
+	def read_page(self, filename):
+
+		with open(filename, 'rb') as source:
+			stats = [os.fstat(source.fileno())]
+			content = source.read()
+
+		if not filename.endswith('.html'):
+			return content, stats
+
+		parts = []
+		position = 0
+
+		for match in INCLUDE_PATTERN.finditer(content):
+			included = self.find_page(match.group(1).decode('utf-8'))
+
+			if included is None:
+				return None
+
+			with open(included, 'rb') as source:
+				stats.append(os.fstat(source.fileno()))
+				parts += [content[position:match.start()], source.read()]
+
+			position = match.end()
+
+		return b''.join(parts + [content[position:]]), stats
+
+	def is_servable(self, environ):
+
+		if environ.get('REQUEST_METHOD') not in ('GET', 'HEAD') or environ.get('QUERY_STRING'):
+			return False
+
+		if not is_prerendered_host(environ.get('HTTP_HOST') or environ.get('SERVER_NAME', '')):
+			return False
+
+		return settings.SESSION_COOKIE_NAME not in parse_cookie(environ.get('HTTP_COOKIE', ''))
+
+	# Whether the client holds the current copy of a file, by its ETag or else by its modification time
+	def is_not_modified(self, environ, etag, modified):
+
+		if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+
+		if if_none_match:
+			etags = parse_etags(if_none_match)
+			return '*' in etags or etag in etags
+
+		if_modified_since = parse_http_date_safe(environ.get('HTTP_IF_MODIFIED_SINCE', ''))
+
+		return if_modified_since is not None and int(modified) <= if_modified_since
+
+	def __call__(self, environ, start_response):
+
+		filename = self.find_page(environ.get('PATH_INFO', '/')) if self.is_servable(environ) else None
+
+		if filename is None:
+			return self.application(environ, start_response)
+
+		result = self.read_page(filename)
+
+		if result is None:
+			return self.application(environ, start_response)
+
+		content, stats = result
+
+		# Files are replaced rather than rewritten, so their modification times and sizes identify the content
+		etag = '-'.join('{0:x}-{1:x}'.format(stat.st_mtime_ns, stat.st_size) for stat in stats)
+		modified = max(stat.st_mtime for stat in stats)
+		validators = [('ETag', quote_etag(etag)), ('Last-Modified', http_date(modified))]
+		headers = self.read_headers(filename)
+
+		if self.is_not_modified(environ, etag, modified):
+			start_response('304 Not Modified', [(name, value) for name, value in headers if name.lower() in NOT_MODIFIED_HEADERS] + validators)
+			return []
+
+		start_response('200 OK', headers + [('Content-Length', str(len(content)))] + validators)
+
+		return [] if environ['REQUEST_METHOD'] == 'HEAD' else [content]
+
+# Get the slice of the listing pages from the one holding the first to the one holding the last of the positions of a
+# post. Positions are counted among the posts listed now, leaving out the post itself. When the post was added to or
+# removed from the listing, every post after it moved by one, so the slice runs to the last page.
+def get_position_pages(posts, per_page, positions, to_end):
+
+	ranks = []
+
+	for position in positions:
+		pub_date, pk = decode_cursor(position)
+		ranks.append(posts.exclude(pk = pk).filter(Q(pub_date__gt = pub_date) | Q(pub_date = pub_date, pk__gt = pk)).count())
+
+	return min(ranks) // per_page, None if to_end else max(ranks) // per_page + 1
+
+# Get the listings of the current site a post is on, as (kind, slug) pairs, given where it is listed
+def get_post_listings(listing, site):
+
+	if listing is None or listing['site'] != site.pk:
+		return set()
+
+	listings = set([('index', None)] + [('tag', slug) for slug in listing['tags']])
+
+	if listing['category']:
+		listings.add(('category', listing['category']))
+
+	return listings
+
+# Get the URLs of the listing pages changes of posts affect: those from where a post was to where it is now,
+# or to the last page when it was added to or removed from a listing
+def get_listing_urls(changes, site, root):
+
+	urls = set()
+
+	for change in changes:
+		before = get_post_listings(change['before'], site)
+		after = get_post_listings(change['after'], site)
+
+		for kind, slug in before | after:
+			positions = [listing['position'] for listing, listings in [(change['before'], before), (change['after'], after)] if (kind, slug) in listings]
+			posts = Post.objects.for_site(site)
+
+			if kind == 'index':
+				paged_urls = get_paged_urls('blogengine:index', get_site_post_count(site.pk), root = root)
+			else:
+				posts = posts.filter(category__slug = slug) if kind == 'category' else posts.filter(tags__slug = slug)
+				instance = taxonomy.get_category(slug) if kind == 'category' else taxonomy.get_tag(slug)
+				count = get_taxonomy_post_count(instance, site.pk) if instance else 0
+				paged_urls = get_paged_urls('blogengine:' + kind, count, root = root, slug = slug)
+
+			first, last = get_position_pages(posts, get_per_page(paged_urls[0]), positions, len(positions) == 1)
+			urls.update(paged_urls[first:last])
+
+	return urls
+
+# Get the URLs whose pages depend on any of the given dependency tags, or None if every page does. Given the
+# changes of posts that bumped the tags, only the listing pages around the positions of those posts are included.
+def get_affected_urls(tags, root, changes = None):
+
+	from blogengine.urls import sitemaps
+
+	# The flat page navigation is shown on every HTML page. The archive sidebar is included from its own file.
+	if 'layout' in tags:
+		return None
+
+	site = Site.objects.get_current()
+	urls = set()
+
+	if changes is not None:
+		urls.update(get_listing_urls(changes, site, root))
+
+	for tag in tags:
+		kind, separator, value = tag.partition(':')
+
+		if kind == 'posts':
+			if changes is None:
+				urls.update(get_paged_urls('blogengine:index', get_site_post_count(site.pk), root = root))
+
+			urls.update([reverse('blogengine:post_archive'), reverse('blogengine:posts_feed'), reverse('blogengine:sitemap')])
+			urls.update(get_sitemap_urls(sitemaps, site))
+
+		# The post as it is now, and wherever it was pre-rendered before
+		elif kind == 'post':
+			urls.update(post.get_absolute_url() for post in Post.objects.filter(slug = value).only('slug', 'pub_date'))
+			urls.update(find_page_urls(root, os.path.join('*', '*', '*', glob.escape(value))))
+
+		elif kind in ('category', 'tag'):
+			if changes is None:
+				instance = taxonomy.get_category(value) if kind == 'category' else taxonomy.get_tag(value)
+				count = get_taxonomy_post_count(instance, site.pk) if instance else 0
+				urls.update(get_paged_urls('blogengine:' + kind, count, root = root, slug = value))
+
+			urls.add(reverse('blogengine:{0}_feed'.format(kind), kwargs = {'slug': value}))
+
+		elif kind == 'month':
+			year, month = value.split('-')
+			urls.add(reverse('blogengine:post_archive_month', kwargs = {'year': year, 'month': '{0:02d}'.format(int(month))}))
+
+		elif kind == 'archive':
+			urls.add(reverse('blogengine:archive_fragment'))
+
+		elif kind == 'flatpages':
+			urls.update(get_sitemap_urls(sitemaps, site))
+
+	return sorted(urls)
+
+# Re-render the pre-rendered pages affected by changed dependency tags. Changes
+# are queued in the database, so none is lost when a process stops before its
+# pages are rebuilt. They are rebuilt in a background thread by default, so
+# saving in the admin does not wait for them, or else right away. With
+# PRERENDER_REBUILD_IN_PROCESS off they are only queued, for the
+# rebuild_prerendered command run by cron or a worker, which also rebuilds
+# what stopped processes left. Nothing is queued until the site has been
+# exported once.
+class RebuildRunner(object):
+
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.thread = None
+
+	def schedule(self, tags, changes = None):
+
+		root = get_prerender_root()
+
+		if not root or not os.path.isdir(root) or not is_enabled():
+			return
+
+		PendingRebuild.objects.create(tags = json.dumps(sorted(tags)), changes = None if changes is None else json.dumps(changes))
+
+		if not getattr(settings, 'PRERENDER_REBUILD_IN_PROCESS', True):
+			return
+
+		if getattr(settings, 'PRERENDER_REBUILD_ASYNC', True):
+			with self.lock:
+				if self.thread is None:
+					self.thread = threading.Thread(target = self.run, args = (root,), daemon = True)
+					self.thread.start()
+
+			return
+
+		self.rebuild(root)
+
+	# Wait for the pages being rebuilt in the background, if any
+	def wait(self):
+
+		thread = self.thread
+
+		if thread is not None:
+			thread.join()
+
+	# Rebuild until no changes are pending, closing this thread's database connection at the end
+	def run(self, root):
+
+		try:
+			self.rebuild(root)
+		finally:
+			connection.close()
+
+	# Rebuild the pages of the queued changes, a batch at a time, until none is left. Returns the number of changes.
+	def rebuild(self, root):
+
+		total = 0
+
+		while True:
+			with self.lock:
+				pending = list(PendingRebuild.objects.order_by('pk')[:REBUILD_BATCH_SIZE])
+
+				if not pending:
+					self.thread = None
+					return total
+
+			urls = set()
+
+			for rebuild in pending:
+				changes = json.loads(rebuild.changes) if rebuild.changes else None
+				affected = get_affected_urls(json.loads(rebuild.tags), root, changes)
+
+				if affected is None:
+					urls = None
+					break
+
+				urls.update(affected)
+
+			if urls is None:
+				urls = get_public_urls()
+				prune(root, [path for path in export_site(root, urls, workers = 1) if path is not None])
+			else:
+				urls = sorted(urls)
+
+				for url, path in zip(urls, export_site(root, urls, workers = 1)):
+					if path is None:
+						remove_page(root, url)
+
+			# Changes queued meanwhile are left for the next batch
+			PendingRebuild.objects.filter(pk__in = [rebuild.pk for rebuild in pending]).delete()
+			total += len(pending)
+
+rebuild_runner = RebuildRunner()
@@ -0,0 +1,65 @@
+import math
+import re
+
+from collections import Counter
+from django.db import transaction
+from django.db.models import Case, Count, ExpressionWrapper, F, FloatField, Sum, Value, When
+
+# Longest term kept in the index, longer words are cut to this length
+TERM_LENGTH = 40
+
+# Weight of a term occurring in the title compared to one in the text
+TITLE_WEIGHT = 5
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+# Split text into lower case search terms
+def tokenize(text):
+	return [word[:TERM_LENGTH] for word in WORD_RE.findall(text.lower())]
+
+# Get the weight of every term of a post
+def get_term_weights(title, text):
+
+	weights = Counter(tokenize(text))
+
+	for term in tokenize(title):
+		weights[term] += TITLE_WEIGHT
+
+	return weights
+
+# Replace the index entries of a post
+def index_post(post):
+
+	from blogengine.models import SearchTerm
+
+	with transaction.atomic():
+		SearchTerm.objects.filter(post = post).delete()
+		SearchTerm.objects.bulk_create([SearchTerm(post = post, term = term, weight = weight)
+			for term, weight in get_term_weights(post.title, post.text).items()])
+
+# Get the posts of a site, or of every site, containing every term of the query, best matches first
+def search_posts(query, site = None):
+
+	from blogengine.counters import get_site_post_count
+	from blogengine.models import Post, SearchTerm
+
+	terms = sorted(set(tokenize(query)))
+	posts = Post.objects.all() if site is None else Post.objects.for_site(site)
+
+	if not terms:
+		return posts
+
+	# Weigh each term by its inverse document frequency over every site
+	total = get_site_post_count()
+	frequencies = dict(SearchTerm.objects.filter(term__in = terms).values_list('term').annotate(Count('post')))
+
+	if len(frequencies) < len(terms):
+		return posts.none()
+
+	score = Sum(Case(*[When(search_terms__term = term,
+		then = ExpressionWrapper(F('search_terms__weight') * Value(math.log(1 + total / frequencies[term])), output_field = FloatField()))
+		for term in terms], output_field = FloatField()))
+
+	return posts.filter(search_terms__term__in = terms).annotate(
+		matches = Count('search_terms'), score = score).filter(
+		matches = len(terms)).order_by('-score', '-pub_date')
@@ -1,22 +1,53 @@
 from django.contrib.sitemaps import Sitemap
 from django.contrib.flatpages.models import FlatPage
+from django.urls import reverse
 from blogengine.models import Post
 
-class PostSitemap(Sitemap):
+# Sitemaps list the items of the given site, or of every site
+class SiteSitemap(Sitemap):
+
+	def __init__(self, site = None):
+		self.site = site
+
+class PostSitemap(SiteSitemap):
 	
 	changefreq = "always"
 	priority = 0.5
 
+	# Well under the 50,000 URL limit, so a stored page stays below the 1 MB memcached item size
+	limit = 5000
+
+	# Only read what the URL and lastmod need, in the order of the (site, pub_date, id) index
 	def items(self):
-		return Post.objects.all()
 
+		posts = Post.objects.all() if self.site is None else Post.objects.for_site(self.site)
+
+		return posts.order_by('pub_date', 'pk').only('slug', 'pub_date', 'modified')
+
+	# Edited posts show when they last changed, so crawlers fetch them again
 	def lastmod(self, obj):
-		return obj.pub_date
+		return obj.modified
 
-class FlatpageSitemap(Sitemap):
+class FlatpageSitemap(SiteSitemap):
 
 	changefreq = "always"
 	priority = 0.5
+	limit = 5000
 
 	def items(self):
-		return FlatPage.objects.all()
\ No newline at end of file
+
+		pages = FlatPage.objects.all() if self.site is None else FlatPage.objects.filter(sites = self.site)
+
+		return pages.order_by('pk').only('url')
+
+# Get the path of every sitemap page of a site. The first page of a section has no number.
+def get_sitemap_urls(sitemaps, site = None):
+
+	urls = []
+
+	for section in sorted(sitemaps):
+		for page in sitemaps[section](site).paginator.page_range:
+			kwargs = {'section': section, 'page': page} if page > 1 else {'section': section}
+			urls.append(reverse('blogengine:sitemap_section', kwargs = kwargs))
+
+	return urls
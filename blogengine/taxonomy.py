@@ -0,0 +1,69 @@
+import threading
+
+from blogengine.cache import get_versions
+
+# Per-process registry of all categories and tags, keyed by slug, with their
+# post counts on each site. The taxonomy is small and rarely changes, so it is
+# loaded once and reloaded only when the shared 'taxonomy' version is bumped by
+# a save or delete, or a change of the counters, in any process.
+class TaxonomyRegistry(object):
+
+	tag = 'taxonomy'
+
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.version = None
+		self.categories = {}
+		self.tags = {}
+		self.post_counts = {}
+		self.modified = None
+
+	def load(self):
+
+		from blogengine.models import Category, Tag, SiteCategoryCount, SiteTagCount
+
+		version = get_versions([self.tag])[self.tag]
+
+		if version == self.version:
+			return
+
+		with self.lock:
+			if version != self.version:
+				categories = dict((category.slug, category) for category in Category.objects.all())
+				tags = dict((tag.slug, tag) for tag in Tag.objects.all())
+				modified = max([item.modified for item in list(categories.values()) + list(tags.values())] or [None])
+				post_counts = dict(((Category, pk, site_id), count)
+					for pk, site_id, count in SiteCategoryCount.objects.values_list('category_id', 'site_id', 'post_count'))
+				post_counts.update(((Tag, pk, site_id), count)
+					for pk, site_id, count in SiteTagCount.objects.values_list('tag_id', 'site_id', 'post_count'))
+
+				# Swap in the new maps together
+				self.categories, self.tags, self.post_counts, self.modified, self.version = categories, tags, post_counts, modified, version
+
+	def get_category(self, slug):
+
+		self.load()
+
+		return self.categories.get(slug)
+
+	def get_tag(self, slug):
+
+		self.load()
+
+		return self.tags.get(slug)
+
+	# Number of posts of a category or tag on a site
+	def get_post_count(self, instance, site_id):
+
+		self.load()
+
+		return self.post_counts.get((instance._meta.concrete_model, instance.pk, site_id), 0)
+
+	# Newest modification time of any category or tag
+	def get_modified(self):
+
+		self.load()
+
+		return self.modified
+
+taxonomy = TaxonomyRegistry()
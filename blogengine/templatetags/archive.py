@@ -0,0 +1,61 @@
+from django import template
+from django.db.models import Count
+from django.db.models.functions import TruncMonth
+from django.contrib.sites.shortcuts import get_current_site
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.safestring import mark_safe
+from blogengine.cache import get_entry, set_entry, get_entry_timeout, get_versions, get_site_tags, release_entry
+from blogengine.models import Post
+from blogengine.prerender import get_include, is_prerender_request
+
+register = template.Library()
+
+# The months of each site are counted with a single aggregate query and kept
+# under the 'archive' dependency tag of the site, which only changes when a
+# post is published, removed or moved to another date.
+
+def get_archive_key(site_id):
+	return 'archive:months:{0}'.format(site_id)
+
+# Get the number of posts of every month of a site, newest first, grouped by year
+def get_archive_years(site_id):
+
+	tags = get_site_tags(site_id, ['archive'])
+	key = get_archive_key(site_id)
+	years = get_entry(key, tags)
+
+	if years is None:
+		versions = get_versions(tags)
+		years = []
+
+		try:
+			months = (Post.objects.for_site(site_id).annotate(month = TruncMonth('pub_date'))
+				.values('month').annotate(count = Count('pk')).order_by('-month'))
+
+			for row in months:
+				if not years or years[-1]['year'] != row['month'].year:
+					years.append({'year': row['month'].year, 'months': []})
+
+				years[-1]['months'].append({'date': row['month'], 'count': row['count']})
+
+			set_entry(key, versions, years, get_entry_timeout())
+		finally:
+			release_entry(key)
+
+	return years
+
+# Render the archive sidebar of a site
+def render_archive_sidebar(site_id):
+	return render_to_string('blogengine/includes/archive_sidebar.html', {'years': get_archive_years(site_id)})
+
+@register.simple_tag(takes_context = True)
+# Render the archive sidebar of the site of the request. Pre-rendered pages include it from its own file instead.
+def archive_sidebar(context):
+
+	request = context.get('request')
+
+	if is_prerender_request(request):
+		return get_include(reverse('blogengine:archive_fragment'))
+
+	return mark_safe(render_archive_sidebar(get_current_site(request).pk))
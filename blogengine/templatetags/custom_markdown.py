@@ -1,16 +1,12 @@
-import markdown2
-
 from django import template
 from django.template.defaultfilters import stringfilter
-from django.utils.encoding import force_text
 from django.utils.safestring import mark_safe
+from blogengine.markup import markdown_memo
 
 register = template.Library()
 
 @register.filter(is_safe = True)
 @stringfilter
-# Define custom markdown
+# Define custom markdown, memoized on the text and extras
 def custom_markdown(value):
-	extras = ["fenced-code-blocks"]
-
-	return mark_safe(markdown2.markdown(force_text(value), extras = extras))
+	return mark_safe(markdown_memo.render(value))
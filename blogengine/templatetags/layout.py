@@ -0,0 +1,37 @@
+from django import template
+from django.contrib.sites.shortcuts import get_current_site
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
+from blogengine.cache import get_entry, set_entry, get_entry_timeout, get_versions, get_site_tags, release_entry
+from blogengine.prerender import is_prerender_request
+
+register = template.Library()
+
+# Parts of the layout shown on every page are rendered once per site and kept
+# under the given dependency tags, e.g. 'layout' for the flat page navigation,
+# which is bumped whenever a flat page is saved or deleted.
+
+@register.simple_tag(takes_context = True)
+# Render a layout template, or reuse it while its tags are unchanged
+def layout_fragment(context, template_name, *tags):
+
+	request = context.get('request')
+	site_id = get_current_site(request).pk
+	key = 'fragment:{0}:{1}'.format(site_id, template_name)
+
+	# Pre-rendered pages hold includes in place of some parts, and are kept apart
+	if is_prerender_request(request):
+		key += ':prerender'
+	tags = get_site_tags(site_id, tags)
+	html = get_entry(key, tags)
+
+	if html is None:
+		versions = get_versions(tags)
+
+		try:
+			html = get_template(template_name).render({'request': request})
+			set_entry(key, versions, html, get_entry_timeout())
+		finally:
+			release_entry(key)
+
+	return mark_safe(html)
@@ -0,0 +1,60 @@
+from django import template
+from django.conf import settings
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
+from blogengine.cache import get_entries, set_entries, get_versions, release_entry
+
+register = template.Library()
+
+# Cards are cached under a key holding the modification time of the post and
+# the version of the category and tag names, so changing a post only replaces
+# its own card, while renaming a category or tag replaces them all. The names
+# have their own version, as the taxonomy version also changes with the post
+# counters on every publish. Old cards expire by themselves. Like the other
+# entries, an expired card is rebuilt by one process while the others serve it.
+
+# Dependency tag of the category and tag names shown on the cards
+LABELS_TAG = 'labels'
+
+def get_card_key(post, labels_version):
+	return 'post_card:{0}:{1}:{2}'.format(post.pk, post.modified.strftime('%Y%m%d%H%M%S%f'), labels_version)
+
+# Render the cards of posts, reading the cached ones in one round trip and storing the new ones in another
+def render_post_cards(posts):
+
+	posts = list(posts)
+	labels_version = get_versions([LABELS_TAG])[LABELS_TAG]
+	keys = [get_card_key(post, labels_version) for post in posts]
+	found = get_entries(keys, [])
+	rendered = {}
+	cards = []
+
+	try:
+		card_template = get_template('blogengine/includes/post_card.html')
+
+		for key, post in zip(keys, posts):
+			card = found.get(key)
+
+			if card is None:
+				card = rendered[key] = card_template.render({'post': post})
+
+			cards.append(card)
+
+		if rendered:
+			set_entries(rendered, {}, getattr(settings, 'POST_CARD_TIMEOUT', 60 * 60 * 24))
+	finally:
+		for key in keys:
+			if key not in found:
+				release_entry(key)
+
+	return mark_safe(''.join(cards))
+
+@register.simple_tag
+# Render the card of a post
+def post_card(post):
+	return render_post_cards([post])
+
+@register.simple_tag
+# Render the cards of a list of posts
+def post_cards(posts):
+	return render_post_cards(posts)
@@ -0,0 +1,214 @@
+import threading
+import time
+
+from collections import OrderedDict
+from contextlib import contextmanager
+from django.db import connections
+from django.db.backends.utils import CursorWrapper
+from django.template.backends.django import DjangoTemplates
+
+# Time spent in each phase of a request, and how often it was entered, is
+# collected while the request is handled: database queries, markdown rendering,
+# template rendering, cache lookups and feed generation. Phases can overlap, a
+# query run while rendering a template counts towards both. A phase entered
+# again inside itself is only timed once.
+
+# Phases in the order they are reported
+PHASES = ('db', 'markdown', 'template', 'cache', 'feed')
+
+# Marks a cache miss, as None can be a cached value
+MISSING = object()
+
+_local = threading.local()
+
+class Timing(object):
+
+	def __init__(self):
+		self.start = time.perf_counter()
+		self.phases = OrderedDict((name, {'duration': 0.0, 'calls': 0}) for name in PHASES)
+		self.depths = dict((name, 0) for name in PHASES)
+
+	def get_total(self):
+		return (time.perf_counter() - self.start) * 1000
+
+	# Add to the counters of a phase
+	def count(self, name, **counts):
+
+		phase = self.phases.setdefault(name, {'duration': 0.0, 'calls': 0})
+
+		for counter, value in counts.items():
+			phase[counter] = phase.get(counter, 0) + value
+
+	# Get the value of the Server-Timing header
+	def get_header(self):
+
+		metrics = []
+
+		for name, phase in self.phases.items():
+			if phase['calls']:
+				counters = ', '.join('{0} {1}'.format(value, counter) for counter, value in sorted(phase.items()) if counter != 'duration')
+				metrics.append('{0};dur={1:.3f};desc="{2}"'.format(name, phase['duration'], counters))
+
+		metrics.append('total;dur={0:.3f}'.format(self.get_total()))
+
+		return ', '.join(metrics)
+
+	# Get the phases as a dictionary, for a structured log line
+	def get_report(self):
+
+		phases = dict((name, dict(phase, duration = round(phase['duration'], 3))) for name, phase in self.phases.items() if phase['calls'])
+
+		return {'total': round(self.get_total(), 3), 'phases': phases}
+
+# Get the timing of the current request, or None outside of a timed request
+def get_timing():
+	return getattr(_local, 'timing', None)
+
+# Time the block as a phase of the current request, counting it once and adding the given counters
+@contextmanager
+def timed(name, **counts):
+
+	timing = get_timing()
+
+	if timing is None:
+		yield
+		return
+
+	timing.count(name, calls = 1, **counts)
+	timing.depths[name] = timing.depths.get(name, 0) + 1
+	start = time.perf_counter()
+
+	try:
+		yield
+	finally:
+		timing.depths[name] -= 1
+
+		if not timing.depths[name]:
+			timing.phases[name]['duration'] += (time.perf_counter() - start) * 1000
+
+# Add to the counters of a phase of the current request, if any
+def count(name, **counts):
+
+	timing = get_timing()
+
+	if timing is not None:
+		timing.count(name, **counts)
+
+class TimedCursorWrapper(CursorWrapper):
+
+	def execute(self, sql, params = None):
+
+		with timed('db'):
+			return super(TimedCursorWrapper, self).execute(sql, params)
+
+	def executemany(self, sql, param_list):
+
+		with timed('db'):
+			return super(TimedCursorWrapper, self).executemany(sql, param_list)
+
+# Time the queries of every database connection of this thread. The cursors the
+# connections would make otherwise, which may log the queries, are wrapped.
+@contextmanager
+def time_queries():
+
+	replaced = []
+
+	for connection in connections.all():
+		for name in ('make_cursor', 'make_debug_cursor'):
+			make_cursor = getattr(connection, name)
+			replaced.append((connection, name, connection.__dict__.get(name)))
+			setattr(connection, name, lambda cursor, connection = connection, make_cursor = make_cursor: TimedCursorWrapper(make_cursor(cursor), connection))
+
+	try:
+		yield
+	finally:
+		for connection, name, previous in reversed(replaced):
+			if previous is None:
+				delattr(connection, name)
+			else:
+				setattr(connection, name, previous)
+
+# Collect the timing of the block, such as a request
+@contextmanager
+def collect_timing():
+
+	timing = _local.timing = Timing()
+
+	try:
+		with time_queries():
+			yield timing
+	finally:
+		_local.timing = None
+
+# Cache whose reads and writes are timed, counting the hits and misses
+class TimedCache(object):
+
+	def __init__(self, cache):
+		self.cache = cache
+
+	def __getattr__(self, name):
+		return getattr(self.cache, name)
+
+	def get(self, key, default = None, version = None):
+
+		with timed('cache'):
+			value = self.cache.get(key, MISSING, version = version)
+
+		if value is MISSING:
+			count('cache', misses = 1)
+			return default
+
+		count('cache', hits = 1)
+
+		return value
+
+	def get_many(self, keys, version = None):
+
+		with timed('cache'):
+			found = self.cache.get_many(keys, version = version)
+
+		count('cache', hits = len(found), misses = len(keys) - len(found))
+
+		return found
+
+	def set(self, key, value, timeout = None, version = None):
+
+		with timed('cache', sets = 1):
+			self.cache.set(key, value, timeout, version = version)
+
+	def set_many(self, data, timeout = None, version = None):
+
+		with timed('cache', sets = len(data)):
+			return self.cache.set_many(data, timeout, version = version)
+
+	def add(self, key, value, timeout = None, version = None):
+
+		with timed('cache', sets = 1):
+			return self.cache.add(key, value, timeout, version = version)
+
+# Get a cache timed as part of the current request, or the cache itself outside of one
+def timed_cache(cache):
+	return cache if get_timing() is None else TimedCache(cache)
+
+# Template whose rendering is timed
+class TimedTemplate(object):
+
+	def __init__(self, template):
+		self.template = template
+
+	def __getattr__(self, name):
+		return getattr(self.template, name)
+
+	def render(self, context = None, request = None):
+
+		with timed('template'):
+			return self.template.render(context, request)
+
+# Django template backend whose templates time their rendering
+class TimedDjangoTemplates(DjangoTemplates):
+
+	def from_string(self, template_code):
+		return TimedTemplate(super(TimedDjangoTemplates, self).from_string(template_code))
+
+	def get_template(self, template_name):
+		return TimedTemplate(super(TimedDjangoTemplates, self).get_template(template_name))
@@ -1,9 +1,6 @@
 from django.conf.urls import url
-from django.views.generic import ListView, DetailView
-from django.views.generic.dates import ArchiveIndexView
-from blogengine.models import Category, Tag, Post
-from blogengine.views import CategoryListView, TagListView, PostMonthArchiveView, PostsFeed, CategoryPostsFeed, TagPostsFeed, getSearchResults
-from django.contrib.sitemaps.views import sitemap
+from blogengine.models import Category, Tag
+from blogengine.views import PostListView, PostDetailView, CategoryListView, TagListView, PostArchiveView, PostMonthArchiveView, PostsFeed, CategoryPostsFeed, TagPostsFeed, getSearchResults, sitemap_index, sitemap_section, archive_fragment
 from blogengine.sitemap import PostSitemap, FlatpageSitemap
 
 # Define appname
@@ -19,40 +16,41 @@ sitemaps = {
 
 urlpatterns = [
 		# Index
-		url('^(?P<page>\d+)?/?$', ListView.as_view(
-			model = Post, paginate_by = 5,
+		url('^(?P<page>\d+)?/?$', PostListView.as_view(
+			paginate_by = 5,
 			), name = 'index'),
 
 		# Individual posts
-		url(r'^(?P<pub_date__year>\d{4})/(?P<pub_date__month>\d{1,2})/(?P<pub_date__day>\d{1,2})/(?P<slug>[a-zA-Z0-9-]+)/?$', DetailView.as_view(model = Post,
+		url(r'^(?P<pub_date__year>\d{4})/(?P<pub_date__month>\d{1,2})/(?P<pub_date__day>\d{1,2})/(?P<slug>[a-zA-Z0-9-]+)/?$', PostDetailView.as_view(
 			), name = 'post'),
 
 		# Categories
-		url(r'^category/(?P<slug>[a-zA-Z0-9-]+)/?$', CategoryListView.as_view(paginate_by = 5, model = Category,
+		url(r'^category/(?P<slug>[a-zA-Z0-9-]+)(?:/(?P<page>\d+))?/?$', CategoryListView.as_view(paginate_by = 5, model = Category,
 			), name = 'category'),
 
 		# Tags
-		url(r'^tag/(?P<slug>[a-zA-Z0-9-]+)/?$', TagListView.as_view(
+		url(r'^tag/(?P<slug>[a-zA-Z0-9-]+)(?:/(?P<page>\d+))?/?$', TagListView.as_view(
 			paginate_by = 5, model = Tag,
 			), name = 'tag'),
 
 		# Post RSS feed
-		url(r'^feeds/posts/$', PostsFeed()),
+		url(r'^feeds/posts/$', PostsFeed(), name = 'posts_feed'),
 
 		# Category RSS feed
-    url(r'^feeds/posts/category/(?P<slug>[a-zA-Z0-9-]+)/?$', CategoryPostsFeed()),
+    url(r'^feeds/posts/category/(?P<slug>[a-zA-Z0-9-]+)/?$', CategoryPostsFeed(), name = 'category_feed'),
 
     # Tag RSS feed
-    url(r'^feeds/posts/tag/(?P<slug>[a-zA-Z0-9-]+)/?$', TagPostsFeed()),
+    url(r'^feeds/posts/tag/(?P<slug>[a-zA-Z0-9-]+)/?$', TagPostsFeed(), name = 'tag_feed'),
 
     # Search posts
     url(r'^search', getSearchResults, name = 'search'),
 
-    # Sitemap
-    url(r'^sitemap\.xml$', sitemap, {'sitemaps': sitemaps}, name = 'django.contrib.sitemaps.views.sitemap'),
+    # Sitemap index and the paged sitemap of each section
+    url(r'^sitemap\.xml$', sitemap_index, {'sitemaps': sitemaps}, name = 'sitemap'),
+    url(r'^sitemap-(?P<section>[a-z]+)(?:-(?P<page>\d+))?\.xml$', sitemap_section, {'sitemaps': sitemaps}, name = 'sitemap_section'),
 
     # Archive
-    url(r'^archive/$', ArchiveIndexView.as_view(model = Post, date_field = "pub_date"),
+    url(r'^archive/$', PostArchiveView.as_view(),
     	name = "post_archive"),
 
     # Month archive
@@ -60,4 +58,7 @@ urlpatterns = [
     	PostMonthArchiveView.as_view(month_format = '%m'),
     	name = "post_archive_month"),
 
+    # Archive sidebar, included by the pre-rendered pages
+    url(r'^fragments/archive\.html$', archive_fragment, name = "archive_fragment"),
+
 ]
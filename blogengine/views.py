@@ -1,136 +1,375 @@
-import markdown2
-
-from django.shortcuts import get_object_or_404, render_to_response
-from django.core.paginator import Paginator, EmptyPage
-from django.db.models import Q
-from django.views.generic import ListView
-from django.views.generic.dates import MonthArchiveView
-from django.contrib.syndication.views import Feed
-from blogengine.models import Category, Tag, Post
+import hashlib
+
+from django.conf import settings
+from django.shortcuts import render_to_response
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils.html import escape
+from django.contrib.sites.shortcuts import get_current_site
+from django.utils.http import http_date, quote_etag
+from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from django.db.models import Count, Max
+from django.views.generic import ListView, DetailView
+from django.views.generic.dates import ArchiveIndexView, MonthArchiveView
+from django.contrib.syndication.views import Feed, add_domain
+from blogengine.models import Post
+from blogengine.search import search_posts
+from blogengine.sitemap import get_sitemap_urls
+from blogengine.pagination import KeysetPaginationMixin, CountedPaginationMixin
+from blogengine.counters import get_site_post_count, get_taxonomy_post_count
+from blogengine.taxonomy import taxonomy
+from blogengine.conditional import ConditionalMixin
+from blogengine.cache import get_request_tags, get_url_key, get_entry, set_entry, get_entry_timeout, get_versions, release_entry
+from blogengine.templatetags.archive import render_archive_sidebar
+from blogengine.timing import timed
 from django.utils.safestring import mark_safe
-from django.utils.encoding import force_text
 
-class CategoryListView(ListView):
+# Get the newest modification time and the number of posts of a queryset, as the state of a page listing them
+def get_posts_state(queryset, count = None):
+
+	if count is None:
+		found = queryset.order_by().aggregate(modified = Max('modified'), count = Count('pk'))
+		return found['modified'], found['count']
+
+	return queryset.order_by().aggregate(modified = Max('modified'))['modified'], count
+
+# Lets a view read the posts of the site of the request
+class SitePostsMixin(object):
+
+	def get_site(self):
+		return get_current_site(self.request)
+
+	def get_posts(self):
+		return Post.objects.for_site(self.get_site())
+
+	def get_queryset(self):
+		return self.get_posts().with_relations()
+
+class PostListView(SitePostsMixin, ConditionalMixin, KeysetPaginationMixin, CountedPaginationMixin, ListView):
+
+	def get_object_count(self):
+		return get_site_post_count(self.get_site().pk)
+
+	def get_modified_state(self):
+		return get_posts_state(self.get_posts(), self.get_object_count())
+
+class PostDetailView(SitePostsMixin, ConditionalMixin, DetailView):
+
+	def get_modified_state(self):
+
+		modified = self.get_posts().filter(slug = self.kwargs['slug']).values_list('modified', flat = True).first()
+
+		return None if modified is None else (modified, None)
+
+class CategoryListView(SitePostsMixin, ConditionalMixin, KeysetPaginationMixin, CountedPaginationMixin, ListView):
 
 	template_name = 'blogengine/category_post_list.html'
 
 	def get_queryset(self):
-		slug = self.kwargs['slug']
+		self.category = taxonomy.get_category(self.kwargs['slug'])
 
-		try:
-			category = Category.objects.get(slug = slug)
-			return Post.objects.filter(category = category)
-			
-		except Category.DoesNotExist:
+		if self.category is None:
 			return Post.objects.none()
 
-	def get_context_data(self, **kwargs):
+		return self.get_posts().with_relations().filter(category = self.category)
 
-		context = super(CategoryListView, self).get_context_data( **kwargs)
-		slug = self.kwargs['slug']
+	def get_object_count(self):
+		return get_taxonomy_post_count(self.category, self.get_site().pk) if self.category else 0
 
-		try:
-			context['category'] = Category.objects.get(slug = slug)
+	def get_modified_state(self):
 
-		except Category.DoesNotExist:
-			context['category'] = None
+		category = taxonomy.get_category(self.kwargs['slug'])
+
+		if category is None:
+			return None
+
+		return get_posts_state(self.get_posts().filter(category = category), get_taxonomy_post_count(category, self.get_site().pk))
+
+	def get_context_data(self, **kwargs):
+
+		context = super(CategoryListView, self).get_context_data( **kwargs)
+		context['category'] = self.category
 		
 		return context
 
-class TagListView(ListView):
+class TagListView(SitePostsMixin, ConditionalMixin, KeysetPaginationMixin, CountedPaginationMixin, ListView):
 
 	template_name = 'blogengine/tag_post_list.html'
 
 	def get_queryset(self):
-		slug = self.kwargs['slug']
+		self.tag = taxonomy.get_tag(self.kwargs['slug'])
 
-		try:
-			tag = Tag.objects.get(slug = slug)
-			return tag.post_set.all()
-
-		except Tag.DoesNotExist:
+		if self.tag is None:
 			return Post.objects.none()
 
+		return self.get_posts().with_relations().filter(tags = self.tag)
+
+	def get_object_count(self):
+		return get_taxonomy_post_count(self.tag, self.get_site().pk) if self.tag else 0
+
+	def get_modified_state(self):
+
+		tag = taxonomy.get_tag(self.kwargs['slug'])
+
+		if tag is None:
+			return None
+
+		return get_posts_state(self.get_posts().filter(tags = tag), get_taxonomy_post_count(tag, self.get_site().pk))
+
 	def get_context_data(self, **kwargs):
 
 		context = super(TagListView, self).get_context_data(**kwargs)
-		slug = self.kwargs['slug']
-
-		try:
-			context['tag'] = Tag.objects.get(slug = slug)
-		except Tag.DoesNotExist:
-			context['tag'] = None
+		context['tag'] = self.tag
 
 		return context
 
 #class MonthListView(ListView):	
 
-class PostMonthArchiveView(MonthArchiveView):
+class PostArchiveView(SitePostsMixin, ConditionalMixin, ArchiveIndexView):
+
+	date_field = "pub_date"
+
+	def get_modified_state(self):
+		return get_posts_state(self.get_posts(), get_site_post_count(self.get_site().pk))
+
+class PostMonthArchiveView(SitePostsMixin, ConditionalMixin, MonthArchiveView):
 
-	queryset = Post.objects.all()
 	date_field = "pub_date"
 	allow_future = True
 
+	def get_modified_state(self):
+
+		try:
+			year, month = int(self.kwargs['year']), int(self.kwargs['month'])
+		except ValueError:
+			return None
+
+		return get_posts_state(self.get_posts().filter(pub_date__year = year, pub_date__month = month))
+
 class PostsFeed(Feed):
 
 	title = 'RSS feed - posts'
 	link = 'feeds/posts/'
 	description = 'RSS feed - blog posts'
 
-	def items(self):
-		return Post.objects.order_by('-pub_date')
+	# Serve the feed XML built after the last change of its posts, with validators for conditional GETs.
+	# It was last modified when it was built, as editing an older post leaves the newest publication date as it is.
+	def __call__(self, request, *args, **kwargs):
+
+		tags = get_request_tags(request)
+
+		if tags is None:
+			with timed('feed'):
+				return super(PostsFeed, self).__call__(request, *args, **kwargs)
+
+		key = get_url_key('feed', request)
+		feed = get_entry(key, tags)
+
+		if feed is None:
+			versions = get_versions(tags)
+
+			try:
+				with timed('feed'):
+					response = super(PostsFeed, self).__call__(request, *args, **kwargs)
+
+				feed = {
+					'content': response.content,
+					'content_type': response['Content-Type'],
+					'last_modified': http_date(),
+					'etag': quote_etag(hashlib.md5(response.content).hexdigest()),
+				}
+				set_entry(key, versions, feed, get_entry_timeout())
+			finally:
+				release_entry(key)
+
+		response = HttpResponse(feed['content'], content_type = feed['content_type'])
+		response['ETag'] = feed['etag']
+
+		response['Last-Modified'] = feed['last_modified']
+
+		return response
+
+	# Number of posts in a feed
+	def get_item_limit(self):
+		return getattr(settings, 'FEED_ITEM_LIMIT', 20)
+
+	# Posts of a site, newest first, with their site for the links in the descriptions
+	def get_items(self, site, **filters):
+		return Post.objects.for_site(site).with_relations().select_related('site').filter(**filters).order_by('-pub_date')[:self.get_item_limit()]
+
+	# The feed object is the site of the request, as feeds are shared by every request
+	def get_object(self, request):
+		return get_current_site(request)
+
+	def items(self, site):
+		return self.get_items(site)
 
 	def item_title(self, item):
 		return item.title
 
+	def item_pubdate(self, item):
+		return item.pub_date
+
+	# The excerpt, with a link to the full post when it leaves part of it out
 	def item_description(self, item):
 
-		extras = ['fenced-code-blocks']
+		if not item.has_more:
+			return mark_safe(item.excerpt)
 
-		content = mark_safe(markdown2.markdown(force_text(item.text), extras = extras))
+		link = add_domain(item.site.domain, item.get_absolute_url())
 
-		return content
+		return mark_safe('{0}<p><a href="{1}">Read more</a></p>'.format(item.excerpt, escape(link)))
 
+# The feed object of the category and tag feeds is a (site, category or tag) pair
 class CategoryPostsFeed(PostsFeed):
 
 	def get_object(self, request, slug):
-		return get_object_or_404(Category, slug = slug)
+
+		category = taxonomy.get_category(slug)
+
+		if category is None:
+			raise Http404('No category found matching the query')
+
+		return get_current_site(request), category
 
 	def title(self, obj):
-		return 'RSS feed - blog posts in category {0}'.format(str(obj.name))
+		return 'RSS feed - blog posts in category {0}'.format(str(obj[1].name))
 
 	def link(self, obj):
-		return obj.get_absolute_url()
+		return obj[1].get_absolute_url()
 
 	def description(self, obj):
-		return 'RSS feed - blog posts in category {0}'.format(str(obj.name))
+		return 'RSS feed - blog posts in category {0}'.format(str(obj[1].name))
 
 	def items(self, obj):
-		return Post.objects.filter(category = obj).order_by('-pub_date')
+		return self.get_items(obj[0], category = obj[1])
 
 class TagPostsFeed(PostsFeed):
 
 	def get_object(self, request, slug):
-		return get_object_or_404(Tag, slug = slug)
+
+		tag = taxonomy.get_tag(slug)
+
+		if tag is None:
+			raise Http404('No tag found matching the query')
+
+		return get_current_site(request), tag
 
 	def title(self, obj):
-		return 'RSS feed - blog posts tagged  {0}'.format(obj.name)
+		return 'RSS feed - blog posts tagged  {0}'.format(obj[1].name)
 
 	def link(self, obj):
-		return obj.get_absolute_url()
+		return obj[1].get_absolute_url()
 
 	def description(self, obj):
-		return 'RSS feed - blog posts tagged {0}'.format(obj.name)
+		return 'RSS feed - blog posts tagged {0}'.format(obj[1].name)
 
 	def items(self, obj):
+		return self.get_items(obj[0], tags = obj[1])
+
+# Get a sitemap attribute, which may be a method taking the item
+def get_sitemap_value(site, name, item):
+
+	value = getattr(site, name, None)
+
+	return value(item) if callable(value) else value
+
+# Yield the XML of a sitemap page one URL at a time, and store it once it is complete
+def stream_sitemap(site, items, base_url, key, versions):
+
+	chunks = []
+
+	def emit(chunk):
+		chunks.append(chunk)
+		return chunk
+
+	# Release the rebuild lock even if the client stops reading
+	try:
+		yield emit('<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n')
+
+		for item in items.iterator():
+			url = '<url><loc>{0}</loc>'.format(escape(base_url + site.location(item)))
+			lastmod = get_sitemap_value(site, 'lastmod', item)
+			changefreq = get_sitemap_value(site, 'changefreq', item)
+			priority = get_sitemap_value(site, 'priority', item)
+
+			if lastmod:
+				url += '<lastmod>{0}</lastmod>'.format(lastmod.strftime('%Y-%m-%d'))
+			if changefreq:
+				url += '<changefreq>{0}</changefreq>'.format(changefreq)
+			if priority is not None:
+				url += '<priority>{0:.1f}</priority>'.format(priority)
+
+			yield emit(url + '</url>\n')
+
+		yield emit('</urlset>\n')
+
+		set_entry(key, versions, ''.join(chunks), get_entry_timeout())
+	finally:
+		release_entry(key)
+
+def sitemap_index(request, sitemaps):
+
+	"""
+	List the sitemap pages of every section
+	"""
+
+	tags = get_request_tags(request)
+	key = get_url_key('sitemap', request)
+	content = get_entry(key, tags)
+
+	if content is None:
+		versions = get_versions(tags)
+		base_url = '{0}://{1}'.format(request.scheme, get_current_site(request).domain)
+		content = '<?xml version="1.0" encoding="UTF-8"?>\n<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+
+		try:
+			for url in get_sitemap_urls(sitemaps, get_current_site(request)):
+				content += '<sitemap><loc>{0}</loc></sitemap>\n'.format(escape(base_url + url))
+
+			content += '</sitemapindex>\n'
+			set_entry(key, versions, content, get_entry_timeout())
+		finally:
+			release_entry(key)
+
+	return HttpResponse(content, content_type = 'application/xml')
+
+def sitemap_section(request, sitemaps, section, page = None):
+
+	"""
+	Stream one page of the sitemap of a section
+	"""
+
+	if section not in sitemaps:
+		raise Http404('No sitemap section {0}'.format(section))
+
+	tags = get_request_tags(request)
+	key = get_url_key('sitemap', request)
+	content = get_entry(key, tags)
+
+	if content is not None:
+		return HttpResponse(content, content_type = 'application/xml')
+
+	site = sitemaps[section](get_current_site(request))
+
+	try:
+		items = site.paginator.page(page or 1).object_list
+	except (EmptyPage, PageNotAnInteger):
+		release_entry(key)
+		raise Http404('No page {0} in sitemap section {1}'.format(page, section))
+
+	versions = get_versions(tags)
+	base_url = '{0}://{1}'.format(request.scheme, get_current_site(request).domain)
+
+	return StreamingHttpResponse(stream_sitemap(site, items, base_url, key, versions), content_type = 'application/xml')
 
-		tag = Tag.objects.get(slug = obj.slug)
-		return tag.post_set.all()
+# Archive sidebar on its own, included by the pre-rendered pages
+def archive_fragment(request):
+	return HttpResponse(render_archive_sidebar(get_current_site(request).pk))
 
 def getSearchResults(request):
 
 	"""
-	Search for a post by title or text
+	Search for a post by title or text, using the search index
 	"""
 
 	# Get the query data
@@ -138,7 +377,7 @@ def getSearchResults(request):
 	page = request.GET.get('page', 1)
 
 	# Query the database
-	results = Post.objects.filter(Q(text__icontains = query) | Q(title__icontains = query))
+	results = search_posts(query, get_current_site(request)).with_relations()
 	
 	# Add pagination
 	pages = Paginator(results, 5)
@@ -0,0 +1,56 @@
+import os
+
+import dj_database_url
+
+from collections import OrderedDict
+
+# The database is configured from DATABASE_URL. Connections are kept open by
+# each worker for DATABASE_CONN_MAX_AGE seconds and checked before they are
+# reused in a new request. PostgreSQL connections can instead be shared by the
+# threads of a worker through a pool of DATABASE_POOL_SIZE connections.
+#
+# Read replicas are configured from DATABASE_REPLICA_URLS, a list of URLs
+# separated by spaces or commas, with the same connection settings.
+
+# Engines dj_database_url gives for PostgreSQL URLs
+POSTGRESQL_ENGINES = ('django.db.backends.postgresql', 'django.db.backends.postgresql_psycopg2')
+
+def get_env_flag(name, default):
+	return os.environ.get(name, str(default)).lower() in ('1', 'true', 'yes', 'on')
+
+# Get the settings of a database from an environment variable holding its URL
+def get_database_config(env = 'DATABASE_URL', default = None):
+	return configure_connections(dj_database_url.config(env = env, default = default,
+		conn_max_age = int(os.environ.get('DATABASE_CONN_MAX_AGE', 600))))
+
+# Get the settings of each read replica, keyed by the alias of its database
+def get_replica_configs(env = 'DATABASE_REPLICA_URLS'):
+
+	replicas = OrderedDict()
+
+	for number, url in enumerate(os.environ.get(env, '').replace(',', ' ').split(), 1):
+		config = configure_connections(dj_database_url.parse(url,
+			conn_max_age = int(os.environ.get('DATABASE_CONN_MAX_AGE', 600))))
+
+		# Tests read the replicas through the connections to the test database
+		config['TEST'] = {'MIRROR': 'default'}
+		replicas['replica_{0}'.format(number)] = config
+
+	return replicas
+
+# Add the health check and pool settings to the settings of a PostgreSQL database
+def configure_connections(config):
+
+	if config.get('ENGINE') not in POSTGRESQL_ENGINES:
+		return config
+
+	config['ENGINE'] = 'gamgee.db.backends.postgresql'
+	config['HEALTH_CHECKS'] = get_env_flag('DATABASE_HEALTH_CHECKS', True)
+	pool_size = int(os.environ.get('DATABASE_POOL_SIZE', 0))
+
+	# Pooled connections go back to the pool at the end of each request instead of staying with the thread
+	if pool_size:
+		config['POOL'] = {'MIN': 1, 'MAX': pool_size}
+		config['CONN_MAX_AGE'] = 0
+
+	return config
@@ -0,0 +1,106 @@
+import threading
+
+from psycopg2 import pool as psycopg2_pool
+from django.db.backends.postgresql.base import Database, DatabaseWrapper as PostgreSQLDatabaseWrapper
+
+# PostgreSQL backend adding two things to the Django one:
+#
+# HEALTH_CHECKS: a persistent connection is checked with a cheap query the
+# first time it is used in a request, and replaced if the server dropped it.
+#
+# POOL: connections are taken from a pool shared by the threads of the
+# process, {'MIN': ..., 'MAX': ...} connections, and given back when Django
+# closes them. Once the pool is exhausted, connections are opened directly.
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+class DatabaseWrapper(PostgreSQLDatabaseWrapper):
+
+	def __init__(self, *args, **kwargs):
+		super(DatabaseWrapper, self).__init__(*args, **kwargs)
+		self.health_check_needed = False
+		self.pooled = False
+
+	def get_pool(self, conn_params):
+
+		options = self.settings_dict.get('POOL')
+
+		if not options:
+			return None
+
+		with _pools_lock:
+			if self.alias not in _pools:
+				_pools[self.alias] = psycopg2_pool.ThreadedConnectionPool(options.get('MIN', 1), options['MAX'], **conn_params)
+
+			return _pools[self.alias]
+
+	# Check that a connection still answers
+	def check_connection(self, connection):
+
+		try:
+			with connection.cursor() as cursor:
+				cursor.execute('SELECT 1')
+		except Database.Error:
+			return False
+
+		return True
+
+	def get_new_connection(self, conn_params):
+
+		pool = self.get_pool(conn_params)
+		self.pooled = False
+
+		if pool is None:
+			return super(DatabaseWrapper, self).get_new_connection(conn_params)
+
+		# Replace pooled connections the server dropped, at most once per connection in the pool
+		for attempt in range(self.settings_dict['POOL']['MAX'] + 1):
+			try:
+				connection = pool.getconn()
+			except psycopg2_pool.PoolError:
+				return super(DatabaseWrapper, self).get_new_connection(conn_params)
+
+			if not self.settings_dict.get('HEALTH_CHECKS') or self.check_connection(connection):
+				break
+
+			pool.putconn(connection, close = True)
+		else:
+			# Every pooled connection failed the check, so open one directly
+			return super(DatabaseWrapper, self).get_new_connection(conn_params)
+
+		self.pooled = True
+
+		# As in the Django backend, but the pooled connection may still hold the isolation level of an earlier user
+		options = self.settings_dict['OPTIONS']
+		self.isolation_level = options.get('isolation_level', Database.extensions.ISOLATION_LEVEL_READ_COMMITTED)
+
+		if connection.isolation_level != self.isolation_level:
+			connection.set_session(isolation_level = self.isolation_level)
+
+		return connection
+
+	def _close(self):
+
+		if self.connection is None or not self.pooled:
+			return super(DatabaseWrapper, self)._close()
+
+		# The pool rolls back an open transaction and drops broken connections
+		with self.wrap_database_errors:
+			self.get_pool(None).putconn(self.connection, close = self.connection.closed != 0)
+
+	# Called by Django at the start and the end of every request
+	def close_if_unusable_or_obsolete(self):
+
+		super(DatabaseWrapper, self).close_if_unusable_or_obsolete()
+		self.health_check_needed = self.connection is not None and bool(self.settings_dict.get('HEALTH_CHECKS'))
+
+	def ensure_connection(self):
+
+		if self.health_check_needed:
+			self.health_check_needed = False
+
+			if self.connection is not None and not self.is_usable():
+				self.close()
+
+		super(DatabaseWrapper, self).ensure_connection()
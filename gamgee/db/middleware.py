@@ -0,0 +1,47 @@
+from django.conf import settings
+from blogengine.cache import REPLICAS_BEHIND_KEY, get_cache, get_request_match
+from gamgee.db.routers import get_replicas, use_replicas, has_written
+
+# Cookie pinning a client to the primary database after it wrote something
+PIN_COOKIE = 'primary_db'
+
+def get_pin_seconds():
+	return getattr(settings, 'DATABASE_REPLICA_PIN_SECONDS', 15)
+
+# Whether the replicas have caught up with the last change. Pages rebuilt right after a change are
+# read from the primary, or the cache would keep them with the old content.
+def replicas_current():
+	return not get_cache().get(REPLICAS_BEHIND_KEY)
+
+class ReplicaMiddleware(object):
+
+	"""
+	Reads GET requests for the routes in DATABASE_REPLICA_ROUTES from the read
+	replicas. A client that writes is read from the primary database for the
+	next DATABASE_REPLICA_PIN_SECONDS seconds, covering the replication lag.
+	Whether the replicas are current is only looked up on the first query, so
+	page cache hits still take a single cache round trip.
+	"""
+
+	def __init__(self, get_response):
+		self.get_response = get_response
+
+	def __call__(self, request):
+
+		with use_replicas(self.should_use_replicas(request) and replicas_current):
+			response = self.get_response(request)
+			wrote = has_written()
+
+		if wrote:
+			response.set_cookie(PIN_COOKIE, '1', max_age = get_pin_seconds(), httponly = True)
+
+		return response
+
+	def should_use_replicas(self, request):
+
+		if not get_replicas() or request.method not in ('GET', 'HEAD') or PIN_COOKIE in request.COOKIES:
+			return False
+
+		match = get_request_match(request)
+
+		return match is not None and match.url_name in getattr(settings, 'DATABASE_REPLICA_ROUTES', ())
@@ -0,0 +1,65 @@
+import random
+import threading
+
+from contextlib import contextmanager
+from django.conf import settings
+
+# Reads of the public pages go to the read replicas, everything else to the
+# primary database. A request that writes is read from the primary for the
+# rest of the request, and the middleware pins the client that made it to the
+# primary for DATABASE_REPLICA_PIN_SECONDS, so that it sees its own changes
+# before they reach the replicas.
+
+_local = threading.local()
+
+# Get the aliases of the read replicas
+def get_replicas():
+	return list(getattr(settings, 'DATABASE_REPLICAS', []))
+
+# Read from the replicas in the block, such as a request for a public page, until something is written.
+# Replicas can be a function, called on the first read only, so blocks that never read pay nothing for it.
+@contextmanager
+def use_replicas(replicas = True):
+
+	previous = getattr(_local, 'replicas', False), getattr(_local, 'wrote', False)
+	_local.replicas = replicas
+	_local.wrote = False
+
+	try:
+		yield
+	finally:
+		_local.replicas, _local.wrote = previous
+
+# Whether something was written in the current block
+def has_written():
+	return getattr(_local, 'wrote', False)
+
+class ReplicaRouter(object):
+
+	def db_for_read(self, model, **hints):
+
+		replicas = get_replicas()
+
+		if not replicas or not getattr(_local, 'replicas', False) or getattr(_local, 'wrote', False):
+			return 'default'
+
+		if callable(_local.replicas):
+			_local.replicas = bool(_local.replicas())
+
+		if _local.replicas:
+			return random.choice(replicas)
+
+		return 'default'
+
+	def db_for_write(self, model, **hints):
+
+		_local.wrote = True
+
+		return 'default'
+
+	# The replicas hold the same data as the primary
+	def allow_relation(self, obj1, obj2, **hints):
+		return True
+
+	def allow_migrate(self, db, app_label, model_name = None, **hints):
+		return False if db in get_replicas() else None
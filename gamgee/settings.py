@@ -49,7 +49,11 @@ INSTALLED_APPS = [
 SITE_ID = 1
 
 MIDDLEWARE = [
+    'blogengine.middleware.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'django.middleware.http.ConditionalGetMiddleware',
+    'gamgee.db.middleware.ReplicaMiddleware',
+    'blogengine.middleware.DependencyCacheMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -58,16 +62,13 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django.contrib.flatpages.middleware.FlatpageFallbackMiddleware',
-    'django.middleware.cache.UpdateCacheMiddleware',
-    'django.middleware.common.CommonMiddleware',
-    'django.middleware.cache.FetchFromCacheMiddleware',
 ]
 
 ROOT_URLCONF = 'gamgee.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'blogengine.timing.TimedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -133,16 +134,85 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 
+# Markdown extras used to render posts. Run the rebuild_markdown command after changing these.
+MARKDOWN_EXTRAS = ['fenced-code-blocks']
+
+# Memo for the custom_markdown filter: entries kept per worker, and seconds kept in the shared cache
+MARKDOWN_MEMO_SIZE = 256
+MARKDOWN_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Number of words in the excerpt of a post without a summary or a <!-- more --> marker
+EXCERPT_WORDS = 100
+
+# Number of posts in each RSS feed
+FEED_ITEM_LIMIT = 20
+
+# Seconds a rendered post card is kept in the cache
+POST_CARD_TIMEOUT = 60 * 60 * 24
+
+# Directory the export_static command writes pre-rendered pages to, served by gamgee/wsgi.py before Django
+PRERENDER_ROOT = os.path.join(BASE_DIR, 'prerendered')
+
+# Render pre-rendered pages as if requested over HTTPS, and re-render the pages affected by changes in a background thread.
+# Without rebuilding in process, changes are only queued for the rebuild_prerendered command.
+PRERENDER_SECURE = False
+PRERENDER_REBUILD_ASYNC = True
+PRERENDER_REBUILD_IN_PROCESS = True
+
+# Report the time spent on queries, markdown, templates, the cache and feeds in a Server-Timing header,
+# and log it as one JSON line per request to the blogengine.timing logger
+SERVER_TIMING = True
+SERVER_TIMING_LOG = False
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'blogengine.timing': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
 JENKINS_TASKS = (
     'django_jenkins.tasks.run_pylint',
 )
 PROJECT_APPS = ['blogengine']
 
 # Heroku config
-# Parse database configuration from $DATABASE_URL
-import dj_database_url
-
-DATABASES['default'] =  dj_database_url.config(default="sqlite:///db.sqlite3")
+# Parse database configuration from $DATABASE_URL. Connections are kept for $DATABASE_CONN_MAX_AGE seconds
+# and checked before reuse unless $DATABASE_HEALTH_CHECKS is off, or pooled when $DATABASE_POOL_SIZE is set.
+from gamgee.db import get_database_config, get_replica_configs
+
+DATABASES['default'] = get_database_config(default = "sqlite:///db.sqlite3")
+
+# Read replicas from $DATABASE_REPLICA_URLS, separated by spaces or commas. GET requests for these routes
+# read from them, unless the client wrote something in the last $DATABASE_REPLICA_PIN_SECONDS seconds.
+DATABASES.update(get_replica_configs())
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['gamgee.db.routers.ReplicaRouter']
+DATABASE_REPLICA_PIN_SECONDS = int(os.environ.get('DATABASE_REPLICA_PIN_SECONDS', 15))
+DATABASE_REPLICA_ROUTES = (
+    'index',
+    'post',
+    'category',
+    'tag',
+    'search',
+    'post_archive',
+    'post_archive_month',
+    'posts_feed',
+    'category_feed',
+    'tag_feed',
+    'sitemap',
+    'sitemap_section',
+)
 
 # Honor the 'X-Forwarded-Proto' header for request.is_secure()
 SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
@@ -189,3 +259,9 @@ CACHES = get_cache()
 CACHE_MIDDLEWARE_ALIAS = 'default'
 CACHE_MIDDLEWARE_SECONDS = 300
 CACHE_MIDDLEWARE_KEY_PREFIX = ''
+
+# Seconds an out of date page or fragment is still served while one process rebuilds it, seconds that process
+# holds the rebuild lock at most, and seconds the others wait for it when there is no old copy to serve
+CACHE_STALE_SECONDS = 60
+CACHE_LOCK_TIMEOUT = 30
+CACHE_LOCK_WAIT = 3
@@ -14,4 +14,7 @@ from dj_static import Cling
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "gamgee.settings")
 
-application = Cling(get_wsgi_application())
+# Static files first, then the pre-rendered pages, then Django
+from blogengine.prerender import PrerenderedApplication
+
+application = Cling(PrerenderedApplication(get_wsgi_application()))